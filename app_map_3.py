@@ -1,462 +1,438 @@
-import osmnx as ox
-import pandas as pd
+import contextlib
+import logging
+import os
+import threading
+import time
+
 import dash
-from dash import html, dcc, Input, Output, dash_table
-import folium
+from dash import html, dcc, Input, Output, State, ClientsideFunction, dash_table
 from shapely.geometry import Point, Polygon
-import plotly.express as px
-import plotly.graph_objects as go
-import requests
 
-# Define the place you want to get data for
-place = 'Al Muneera, Abu Dhabi, United Arab Emirates'
+import charts
+import data_source
+import fetch
+import instrumentation
+import map_render
+from figure_cache import FigureCache, cached_figures
+import osm_cache
+from metric_cube import MetricCube
+import spatial_join
+import summary
 
-# Get the polygon data for the place
-gdf = ox.features_from_place(place, tags={'building': True})
+logger = logging.getLogger(__name__)
+
+# Define the place you want to get data for
+place = osm_cache.DEFAULT_PLACE
 
-# List of names to keep (from the Excel data for merging)
+# The bundled precincts; the first one is selected in the precinct dropdown by default
 names_to_keep = [
     'Al Rahba 1', 'Al Rahba 2', 'Al Maha 1 Block A', 'Al Maha 2 Block A'
 ]
 
-# Filter the GeoDataFrame to keep only the specified names
-gdf_filtered = gdf[gdf['name'].isin(names_to_keep)]
+# Select relevant columns for display
+columns_to_display = ['Precinct Name', 'bill_due_month', 'Billed', 'Received', 'Balance', 'Service charge', 'Rent', 'Misc.', 'Units', 'Average Price', 'Active', 'Inactive', 'Rental Yield', 'Contracts expiring', 'Renewal Rate', 'Renewed', 'Expired', 'Units rent delayed', 'Tickets', 'SLA', 'Type Access', 'Type Facilities', 'Type others']
 
-# Drop duplicates to keep only distinct names
-gdf_filtered = gdf_filtered.drop_duplicates(subset='name')
+# Render the charts clientside from a dcc.Store instead of a server callback per dropdown change
+CLIENTSIDE_CHARTS = os.environ.get('CLIENTSIDE_CHARTS', '').lower() in ('1', 'true', 'yes')
 
-# Fetch the data from GitHub
-url = 'https://raw.githubusercontent.com/mountainmole/App_man/master/data_dict.json'
-response = requests.get(url)
-data_dict = response.json()
+# Load the data in a background thread started by the first request ('background'), or before
+# create_app() returns ('sync'). Use 'sync' with `gunicorn --preload` so the workers share the loaded
+# data copy-on-write; in 'background' mode every worker loads its own copy after the fork.
+DATA_LOADING = os.environ.get('DATA_LOADING', 'background')
 
-# Convert the data dictionary to a DataFrame
-excel_data = pd.DataFrame(data_dict)
-excel_data['bill_due_month'] = pd.to_datetime(excel_data['bill_due_month'])
+# Seconds to wait before retrying a failed background load
+LOAD_RETRY_SECONDS = float(os.environ.get('LOAD_RETRY_SECONDS', 30))
 
-# Filter the data for the months of November and December 2023
-filtered_excel_data_dec = excel_data[excel_data['bill_due_month'] == '2023-12-31']
-filtered_excel_data_nov = excel_data[excel_data['bill_due_month'] == '2023-11-30']
+# Seconds between checks for new billing data while a dashboard is open; 0 turns hot reloading off
+DATA_RELOAD_SECONDS = float(os.environ.get('DATA_RELOAD_SECONDS', 60))
 
-# Select relevant columns for display
-columns_to_display = ['Precinct Name', 'bill_due_month', 'Billed', 'Received', 'Balance', 'Service charge', 'Rent', 'Misc.', 'Units', 'Average Price', 'Active', 'Inactive', 'Rental Yield', 'Contracts expiring', 'Renewal Rate', 'Renewed', 'Expired', 'Units rent delayed', 'Tickets', 'SLA', 'Type Access', 'Type Facilities', 'Type others']
-filtered_excel_data_dec = filtered_excel_data_dec[columns_to_display]
-filtered_excel_data_nov = filtered_excel_data_nov[columns_to_display]
-
-# Merge the GeoDataFrame with the filtered Excel data for December
-merged_gdf_dec = gdf_filtered.merge(filtered_excel_data_dec, how='inner', left_on='name', right_on='Precinct Name')
-
-# Create a folium map
-center = merged_gdf_dec.geometry.unary_union.centroid
-m = folium.Map(location=[center.y, center.x], zoom_start=17)
-
-# Add the filtered polygon data to the map with clickable polygons
-for idx, row in merged_gdf_dec.iterrows():
-    tooltip_text = (f"<b>Precinct Name:</b> {row['Precinct Name']}<br>"
-                    f"<b>Billed:</b> {round(row['Billed'],1)}<br>"
-                    f"<b>Received:</b> {round(row['Received'],1)}<br>"
-                    f"<b>Balance:</b> {round(row['Balance'],1)}<br>"
-                    f"<b>Units:</b> {round(row['Units'], 1)}<br>"
-                    f"<b>Average Price:</b> {round(row['Average Price'],1)}<br>"
-                    f"<b>Active:</b> {round(row['Active'], 1)}<br>"
-                    f"<b>Inactive:</b> {round(row['Inactive'], 1)}<br>"
-                    f"<b>Rental Yield:</b> {row['Rental Yield']*100:.1f}%")
-    folium.GeoJson(row.geometry, tooltip=tooltip_text).add_to(m)
-
-# Save the map to an HTML file
-m.save('al_muneera_filtered_map.html')
-
-# Read HTML file and encode it to base64
-with open('al_muneera_filtered_map.html', 'r') as f:
-    html_content = f.read()
-
-# Calculate summary metrics for the table for December
-summary_metrics_dec = filtered_excel_data_dec.agg({
-    'Billed': 'sum',
-    'Received': 'sum',
-    'Balance': 'sum',
-    'Units': 'sum',
-    'Average Price': 'mean',
-    'Active': 'sum',
-    'Inactive': 'sum',
-    'Rental Yield': 'mean',
-    'Contracts expiring': 'sum',
-    'Renewal Rate': 'mean',
-    'Renewed': 'sum',
-    'Expired': 'sum',
-    'Units rent delayed': 'sum',
-    'Tickets': 'sum',
-    'SLA': 'mean',
-    'Type Access': 'mean',
-    'Type Facilities': 'mean',
-    'Type others': 'mean'
-}).reset_index()
-summary_metrics_dec.columns = ['Metric', 'December Value']
-
-# Calculate summary metrics for the table for November
-summary_metrics_nov = filtered_excel_data_nov.agg({
-    'Billed': 'sum',
-    'Received': 'sum',
-    'Balance': 'sum',
-    'Units': 'sum',
-    'Average Price': 'mean',
-    'Active': 'sum',
-    'Inactive': 'sum',
-    'Rental Yield': 'mean',
-    'Contracts expiring': 'sum',
-    'Renewal Rate': 'mean',
-    'Renewed': 'sum',
-    'Expired': 'sum',
-    'Units rent delayed': 'sum',
-    'Tickets': 'sum',
-    'SLA': 'mean',
-    'Type Access': 'mean',
-    'Type Facilities': 'mean',
-    'Type others': 'mean'
-}).reset_index()
-summary_metrics_nov.columns = ['Metric', 'November Value']
-
-# Merge the summary metrics for both months
-summary_metrics = pd.merge(summary_metrics_dec, summary_metrics_nov, on='Metric')
-summary_metrics['Variance'] = summary_metrics.apply(
-    lambda row: round(float(row['December Value']) - float(row['November Value']), 2) if isinstance(row['December Value'], (int, float)) and isinstance(row['November Value'], (int, float)) else "N/A",
-    axis=1
-)
+# Loaded data shared by the layout and callbacks; 'data' stays None until loading has finished
+# and is replaced as a whole when the billing data changes
+state = {'data': None, 'error': None, 'loader': None}
+state_lock = threading.Lock()
+reload_lock = threading.Lock()
 
-# Apply conditional formatting for color coding
-def determine_background_color(metric, variance):
-    positive_metrics = ['Billed', 'Received', 'Balance', 'Active', 'Rental Yield', 'Renewal Rate', 'Renewed', 'SLA', 'Type Access', 'Type Facilities', 'Type others']
-    negative_metrics = ['Contracts expiring', 'Expired', 'Units rent delayed', 'Tickets', 'Inactive']
-    if variance == "N/A":
-        return ''
-    elif metric in positive_metrics:
-        return 'background-color: green;' if variance > 0 else 'background-color: yellow;'
-    elif metric in negative_metrics:
-        return 'background-color: green;' if variance < 0 else 'background-color: yellow;'
-    return ''
-
-# Function to format values
-def format_value(value, metric):
-    if metric in ['Billed', 'Received', 'Balance', 'Average Price']:
-        return f"{value:.1f}"
-    elif metric in ['Rental Yield', 'Renewal Rate', 'SLA', 'Type Access', 'Type Facilities', 'Type others']:
-        return f"{value * 100:.1f}%"
-    return value
-
-# Format the summary metrics values
-summary_metrics['December Value'] = summary_metrics.apply(lambda row: format_value(row['December Value'], row['Metric']), axis=1)
-summary_metrics['November Value'] = summary_metrics.apply(lambda row: format_value(row['November Value'], row['Metric']), axis=1)
-
-# Create the Dash app
-app = dash.Dash(__name__)
-
-app.layout = html.Div([
-    html.H1("Al Muneera Details"),
-    html.Div([
-        html.Iframe(id='map', srcDoc=html_content, width='50%', height='400'),
-        dash_table.DataTable(
-            id='summary-table',
-            columns=[{"name": i, "id": i} for i in summary_metrics.columns],
-            data=summary_metrics.to_dict('records'),
-            style_table={'width': '50%'},
-            style_cell={
-                'textAlign': 'left',
-                'padding': '5px',
-                'fontFamily': 'Arial',
-                'fontSize': '15px'
-            },
-            style_header={
-                'backgroundColor': 'lightgrey',
-                'fontWeight': 'bold'
-            },
-            style_data_conditional=[
-                {
-                    'if': {'filter_query': '{Metric} = "Billed" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Billed" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Received" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Received" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Balance" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Balance" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Active" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Active" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Inactive" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Inactive" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Rental Yield" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Rental Yield" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Contracts expiring" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Contracts expiring" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Renewal Rate" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Renewal Rate" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Renewed" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Renewed" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Expired" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Expired" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Units rent delayed" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Units rent delayed" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Tickets" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Tickets" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "SLA" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "SLA" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type Access" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type Access" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type Facilities" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type Facilities" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type others" && {Variance} > 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'green'
-                },
-                {
-                    'if': {'filter_query': '{Metric} = "Type others" && {Variance} <= 0', 'column_id': 'Variance'},
-                    'backgroundColor': 'yellow'
-                },
-            ]
-        )
-    ], style={'display': 'flex'}),
-    html.Label("Select Precinct:"),
-    dcc.Dropdown(
-        id='precinct-dropdown',
-        options=[{'label': name, 'value': name} for name in names_to_keep],
-        value=names_to_keep[0]
-    ),
-    html.Div([
-        dcc.Graph(id='combined-chart', style={'display': 'inline-block', 'width': '48%'}),
-        dcc.Graph(id='additional-metrics-chart', style={'display': 'inline-block', 'width': '48%'})
-    ]),
-    html.Div([
-        dcc.Graph(id='contract-metrics-chart', style={'display': 'inline-block', 'width': '48%'}),
-        dcc.Graph(id='sla-chart', style={'display': 'inline-block', 'width': '48%'})  # New chart for Tickets and SLA metrics
-    ])
-])
-
-# Define the callback to update the charts based on selected precinct
-@app.callback(
-    [Output('combined-chart', 'figure'),
-     Output('additional-metrics-chart', 'figure'),
-     Output('contract-metrics-chart', 'figure'),
-     Output('sla-chart', 'figure')],
-    [Input('precinct-dropdown', 'value')]
+# Cache the rendered charts per precinct and data version;
+# set FIGURE_CACHE_DIR to share the cache between gunicorn workers on the same host
+figure_cache = FigureCache(
+    maxsize=int(os.environ.get('FIGURE_CACHE_SIZE', 128)),
+    directory=os.environ.get('FIGURE_CACHE_DIR')
 )
-def update_charts(selected_precinct):
-    if selected_precinct:
-        data = excel_data[excel_data['Precinct Name'] == selected_precinct]
-        data = data.sort_values(by='bill_due_month')
-        
-        # Melt the dataframe to have Billed, Received, and Balance in one column
-        melted_data = data.melt(id_vars=['bill_due_month'], value_vars=['Billed', 'Received', 'Balance'], 
-                                var_name='Type', value_name='Amount')
-        
-        # Create a bar chart with multiple bars
-        combined_fig = go.Figure()
-
-        for metric in ['Billed', 'Received', 'Balance']:
-            combined_fig.add_trace(
-                go.Bar(x=melted_data[melted_data['Type'] == metric]['bill_due_month'],
-                       y=melted_data[melted_data['Type'] == metric]['Amount'],
-                       name=metric)
-            )
 
-        # Add Rental Yield as a line on the secondary y-axis
-        combined_fig.add_trace(
-            go.Scatter(x=data['bill_due_month'],
-                       y=data['Rental Yield'] * 100,
-                       name='Rental Yield (%)',
-                       yaxis='y2',
-                       mode='lines+markers')
-        )
-
-        # Update layout for dual y-axis
-        combined_fig.update_layout(
-            title='Billed, Received, Balance, and Rental Yield Over Time',
-            xaxis=dict(title='Bill Due Month'),
-            yaxis=dict(title='Amount'),
-            yaxis2=dict(title='Rental Yield (%)', overlaying='y', side='right', tickformat='.1f'),
-            barmode='group',
-            legend=dict(orientation="h", yanchor="bottom", y=1, xanchor="right", x=1)
-        )
-        
-        # Calculate additional metrics
-        data['Service charge collected'] = data['Billed'] * data['Service charge']
-        data['Rent collected'] = data['Billed'] * data['Rent']
-        data['Misc Expenses collected'] = data['Billed'] * data['Misc.']
-        
-        # Melt the dataframe for additional metrics
-        additional_melted_data = data.melt(id_vars=['bill_due_month'], 
-                                           value_vars=['Service charge collected', 'Rent collected', 'Misc Expenses collected'],
-                                           var_name='Metric', value_name='Collected Amount')
-        
-        # Create a bar chart for additional metrics
-        additional_fig = px.bar(additional_melted_data, x='bill_due_month', y='Collected Amount', color='Metric', barmode='group',
-                                title='Service Charge, Rent, and Misc Expenses Collected Over Time')
-        
-        # Melt the dataframe for contract metrics
-        contract_melted_data = data.melt(id_vars=['bill_due_month'], 
-                                         value_vars=['Contracts expiring', 'Renewal Rate', 'Renewed', 'Expired', 'Units rent delayed'],
-                                         var_name='Metric', value_name='Count')
-        
-        # Create a bar chart for contract metrics and add Renewal Rate as a line on the secondary axis
-        contract_fig = go.Figure()
-
-        for metric in ['Contracts expiring', 'Renewed', 'Expired', 'Units rent delayed']:
-            contract_fig.add_trace(
-                go.Bar(x=contract_melted_data[contract_melted_data['Metric'] == metric]['bill_due_month'],
-                       y=contract_melted_data[contract_melted_data['Metric'] == metric]['Count'],
-                       name=metric)
+instrumentation.add_gauges('app_figure_cache', figure_cache.stats)
+
+
+# Load the footprints and billing data and derive everything the dashboard shows
+def load_data():
+    startup_start = time.perf_counter()
+
+    # Load the precinct buildings from the local OSM cache
+    # (run `python osm_cache.py refresh` to update it from OpenStreetMap), matched to precincts
+    # spatially when PRECINCT_BOUNDARIES_PATH is set and by building name otherwise
+    def load_footprints():
+        with instrumentation.stage('load_footprints'):
+            return spatial_join.precinct_footprints(place, osm_cache.DEFAULT_TAGS)
+
+    # Load the billing data from the bundled data_dict.json (or BILLING_DATA_PATH / BILLING_DATA_URL)
+    def load_billing():
+        with instrumentation.stage('load_billing_data'):
+            return data_source.load_billing_data(), data_source.data_version()
+
+    # Both loads may fetch over the network, so run them side by side
+    gdf_filtered, (excel_data, version) = fetch.run_all([load_footprints, load_billing])
+
+    loaded = derive_data(gdf_filtered, excel_data, version)
+    instrumentation.record_stage('total', time.perf_counter() - startup_start)
+    return loaded
+
+
+# Derive everything the dashboard shows from the precinct buildings and billing data.
+# Given the previously loaded data, the monthly summary is only recomputed for the changed months
+# and the map is only re-rendered when its content changed.
+def derive_data(gdf_filtered, excel_data, version, previous=None):
+    # Startup stages are only recorded for the first load
+    stage = instrumentation.stage if previous is None else (lambda name: contextlib.nullcontext())
+
+    # Index the billing data once as a precinct x month x metric cube for the chart callback
+    with stage('build_cube'):
+        excel_cube = MetricCube(excel_data)
+
+    # Aggregate the summary metrics for every month once; comparisons only pick rows from this table
+    with stage('summary'):
+        if previous is None:
+            monthly_summary = summary.monthly_aggregates(excel_data)
+        else:
+            monthly_summary = summary.update_aggregates(previous['monthly_summary'], previous['excel_data'],
+                                                        excel_data)
+        summary_months = monthly_summary.index.strftime('%Y-%m-%d').tolist()
+
+        # Compare the latest month with the previous one by default
+        summary_metrics, summary_labels = summary.compare(monthly_summary, summary_months[-1])
+
+    # Filter the data for the latest month
+    latest_data = excel_data[excel_data['bill_due_month'] == monthly_summary.index[-1]]
+    latest_data = latest_data[columns_to_display]
+
+    # Merge the GeoDataFrame with the filtered Excel data for the latest month
+    with stage('merge'):
+        merged_gdf_latest = gdf_filtered.merge(latest_data, how='inner', on='Precinct Name')
+    if merged_gdf_latest.empty:
+        logger.warning('No buildings matched the precincts billed in %s; the map will be empty', summary_months[-1])
+    else:
+        unmatched = sorted(set(latest_data['Precinct Name'].astype(str))
+                           - set(merged_gdf_latest['Precinct Name'].astype(str)))
+        if unmatched:
+            logger.warning('No buildings found for %d precincts billed in %s: %s', len(unmatched),
+                           summary_months[-1], ', '.join(unmatched))
+
+    # Render the map once per distinct geometry/metrics content into the map cache
+    with stage('render_map'):
+        map_name = map_render.map_asset(merged_gdf_latest)
+
+    # Per-precinct series for the clientside renderer, built once per data version
+    chart_payload = charts.clientside_payload(excel_cube) if CLIENTSIDE_CHARTS else None
+
+    return {
+        'chart_payload': chart_payload,
+        'version': version,
+        'gdf_filtered': gdf_filtered,
+        'excel_data': excel_data,
+        'excel_cube': excel_cube,
+        'merged_gdf_latest': merged_gdf_latest,
+        'map_name': map_name,
+        'monthly_summary': monthly_summary,
+        'summary_months': summary_months,
+        'summary_metrics': summary_metrics,
+        'summary_labels': summary_labels,
+    }
+
+
+# Keep retrying the load so a network stall delays readiness instead of killing the worker
+def load_in_background():
+    while True:
+        try:
+            state['data'] = load_data()
+            state['error'] = None
+            return
+        except Exception as e:
+            logger.exception('Loading the dashboard data failed; retrying in %s seconds', LOAD_RETRY_SECONDS)
+            state['error'] = repr(e)
+            time.sleep(LOAD_RETRY_SECONDS)
+
+
+# Start loading the data once per process; this runs before every request in 'background' mode
+def start_loading():
+    if state['data'] is not None or state['loader'] is not None:
+        return
+    with state_lock:
+        if state['data'] is not None or state['loader'] is not None:
+            return
+        if DATA_LOADING == 'sync':
+            state['data'] = load_data()
+            return
+        state['loader'] = threading.Thread(target=load_in_background, name='data-loader', daemon=True)
+        state['loader'].start()
+
+
+# Swap in freshly derived data when the billing source has changed.
+# One request per process rebuilds; the others keep serving the current data meanwhile.
+# Only the data-poll callback checks BILLING_DATA_URL (check_remote); the others read the local copy.
+def reload_data(check_remote=True):
+    loaded = state['data']
+    if loaded is None or not reload_lock.acquire(blocking=False):
+        return loaded
+    try:
+        excel_data = data_source.load_billing_data(check_remote=check_remote)
+        if excel_data is not loaded['excel_data']:
+            with instrumentation.timed('app_data_reload_seconds'):
+                state['data'] = derive_data(loaded['gdf_filtered'], excel_data, data_source.data_version(),
+                                            previous=loaded)
+            logger.info('Reloaded the billing data (version %s)', state['data']['version'])
+            # Keep the previous version's files for pages and workers that have not switched yet
+            data_source.prune_cache([state['data']['version'], loaded['version']])
+            map_render.prune_maps([state['data']['map_name'], loaded['map_name']])
+    except Exception:
+        logger.exception('Reloading the billing data failed; keeping the current data')
+    finally:
+        reload_lock.release()
+    return state['data']
+
+
+# The loaded data, reloaded first when the browser has already seen a newer version from another worker
+def current_data(version=None):
+    loaded = state['data']
+    if loaded is not None and version is not None and version != loaded['version']:
+        loaded = reload_data(check_remote=False)
+    return loaded
+
+
+# Options of the current and comparison period dropdowns
+def period_options(loaded):
+    months = [{'label': f'{month:%B %Y}', 'value': value}
+              for month, value in zip(loaded['monthly_summary'].index, loaded['summary_months'])]
+    relative = [{'label': label, 'value': value} for value, label in summary.RELATIVE_PERIODS.items()]
+    return months, relative + months
+
+
+# Options of the precinct dropdown: every precinct with billing data
+def precinct_options(loaded):
+    return [{'label': 'All precincts', 'value': charts.ALL_PRECINCTS}] + \
+           [{'label': str(name), 'value': str(name)} for name in loaded['excel_cube'].precincts]
+
+
+# Dashboard content below the title, built from the loaded data
+def dashboard_body(app, loaded):
+    current_options, comparison_options = period_options(loaded)
+    return [
+        html.Div([
+            html.Label("Compare:"),
+            dcc.Dropdown(
+                id='current-period',
+                options=current_options,
+                value=loaded['summary_months'][-1],
+                clearable=False,
+                style={'width': '200px'}
+            ),
+            html.Label("with:"),
+            dcc.Dropdown(
+                id='comparison-period',
+                options=comparison_options,
+                value='rolling:1',
+                clearable=False,
+                style={'width': '280px'}
+            ),
+        ], style={'display': 'flex', 'alignItems': 'center', 'gap': '10px'}),
+        html.Div([
+            html.Iframe(id='map', src=app.get_relative_path(f"/maps/{loaded['map_name']}"), width='50%', height='400'),
+            dash_table.DataTable(
+                id='summary-table',
+                columns=summary.table_columns(loaded['summary_labels']),
+                data=loaded['summary_metrics'].to_dict('records'),
+                style_table={'width': '50%'},
+                style_cell={
+                    'textAlign': 'left',
+                    'padding': '5px',
+                    'fontFamily': 'Arial',
+                    'fontSize': '15px'
+                },
+                style_header={
+                    'backgroundColor': 'lightgrey',
+                    'fontWeight': 'bold'
+                },
+                style_data_conditional=summary.VARIANCE_STYLES
             )
+        ], style={'display': 'flex'}),
+        html.Label("Select Precinct:"),
+        dcc.Dropdown(
+            id='precinct-dropdown',
+            options=precinct_options(loaded),
+            value=[names_to_keep[0] if names_to_keep[0] in loaded['excel_cube'].precincts
+                   else str(loaded['excel_cube'].precincts[0])],
+            multi=True
+        ),
+        dcc.RadioItems(
+            id='precinct-view',
+            options=[{'label': label, 'value': value} for value, label in charts.VIEW_MODES.items()],
+            value='aggregate',
+            inline=True
+        ),
+        html.Div([
+            dcc.Graph(id='combined-chart', style={'display': 'inline-block', 'width': '48%'}),
+            dcc.Graph(id='additional-metrics-chart', style={'display': 'inline-block', 'width': '48%'})
+        ]),
+        html.Div([
+            dcc.Graph(id='contract-metrics-chart', style={'display': 'inline-block', 'width': '48%'}),
+            dcc.Graph(id='sla-chart', style={'display': 'inline-block', 'width': '48%'})  # New chart for Tickets and SLA metrics
+        ]),
+        # Per-precinct series shipped once for the clientside renderer
+        dcc.Store(id='chart-data', data=loaded['chart_payload']),
+        # Poll for new billing data and refresh the dashboard in place when it arrives
+        dcc.Store(id='data-version', data=loaded['version']),
+        dcc.Interval(id='data-poll', interval=max(DATA_RELOAD_SECONDS, 1) * 1000, disabled=not DATA_RELOAD_SECONDS)
+    ]
+
+
+# Recompute the summary table when another pair of periods is selected
+@instrumentation.timed_callback('update_summary')
+def update_summary(current_period, comparison_period, version=None):
+    loaded = current_data(version)
+    table, labels = summary.compare(loaded['monthly_summary'], current_period, comparison_period)
+    return summary.table_columns(labels), table.to_dict('records')
+
+
+# Build the four charts for a selection of precincts from one version of the loaded data,
+# cached under the version they are actually built from
+@cached_figures(figure_cache, lambda loaded, selected_precincts, view: (selected_precincts, view, loaded['version']))
+def chart_figures(loaded, selected_precincts, view):
+    # Combine or compare the selected precincts' series straight from the precomputed cube
+    with instrumentation.timed('app_callback_seconds', callback='update_charts', phase='slice'):
+        months, series = charts.select_series(loaded['excel_cube'], selected_precincts, view)
+    with instrumentation.timed('app_callback_seconds', callback='update_charts', phase='build'):
+        return charts.build_figures(months, series)
+
+
+# Build the four charts for the selected precincts on the server
+@instrumentation.timed_callback('update_charts')
+def update_charts(selected_precincts, view, version=None):
+    loaded = current_data(version)
+    if selected_precincts and loaded is not None:
+        if isinstance(selected_precincts, str):
+            selected_precincts = [selected_precincts]
+        return chart_figures(loaded, selected_precincts, view)
+    return dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
-        # Add Renewal Rate as a line on the secondary y-axis
-        contract_fig.add_trace(
-            go.Scatter(x=contract_melted_data[contract_melted_data['Metric'] == 'Renewal Rate']['bill_due_month'],
-                       y=contract_melted_data[contract_melted_data['Metric'] == 'Renewal Rate']['Count'] * 100,
-                       name='Renewal Rate (%)',
-                       yaxis='y2',
-                       mode='lines+markers')
-        )
 
-        # Update layout for dual y-axis
-        contract_fig.update_layout(
-            title='Contract Metrics Over Time',
-            xaxis=dict(title='Bill Due Month'),
-            yaxis=dict(title='Count'),
-            yaxis2=dict(title='Renewal Rate (%)', overlaying='y', side='right', tickformat='.1f'),
-            barmode='group',
-            legend=dict(orientation="h", yanchor="bottom", y=1, xanchor="right", x=1)
+# Create the Dash app. The layout shell is served right away and filled in once the data has loaded.
+def create_app():
+    # Compact figures are served gzip-compressed; DASH_COMPRESS=1 also enables compression on its own
+    app = dash.Dash(__name__, suppress_callback_exceptions=True, compress=charts.COMPACT_FIGURES or None)
+
+    # Serve the rendered maps as cacheable static files
+    map_render.register_routes(app.server)
+
+    # Serve startup and callback timings on /metrics when APP_METRICS is set
+    instrumentation.register_routes(app.server)
+
+    # Expose the figure cache hit/miss counters
+    @app.server.route('/figure-cache')
+    def figure_cache_stats():
+        return figure_cache.stats()
+
+    # Liveness: the process is up and serving requests
+    @app.server.route('/healthz')
+    def healthz():
+        return {'status': 'ok'}
+
+    # Readiness: the data has loaded and the dashboard can be shown
+    @app.server.route('/readyz')
+    def readyz():
+        if state['data'] is None:
+            return {'ready': False, 'error': state['error']}, 503
+        return {'ready': True}
+
+    def serve_layout():
+        loaded = state['data']
+        return html.Div([
+            html.H1("Al Muneera Details"),
+            html.Div(dashboard_body(app, loaded) if loaded is not None else html.P("Loading data..."),
+                     id='page-content'),
+            # Poll until the background load has finished, then swap in the dashboard
+            dcc.Interval(id='loading-poll', interval=1000, disabled=loaded is not None)
+        ])
+
+    app.layout = serve_layout
+
+    @app.callback(
+        [Output('page-content', 'children'),
+         Output('loading-poll', 'disabled')],
+        [Input('loading-poll', 'n_intervals')],
+        prevent_initial_call=True
+    )
+    def show_dashboard(n_intervals):
+        loaded = state['data']
+        if loaded is None:
+            return dash.no_update, False
+        return dashboard_body(app, loaded), True
+
+    # Pick up new billing data and push the new map, periods, precincts and chart data to the page;
+    # the summary and charts follow through their data-version input. A current period left on the
+    # latest month moves on to the new latest month.
+    @app.callback(
+        [Output('data-version', 'data'),
+         Output('map', 'src'),
+         Output('current-period', 'options'),
+         Output('current-period', 'value'),
+         Output('comparison-period', 'options'),
+         Output('precinct-dropdown', 'options'),
+         Output('chart-data', 'data')],
+        [Input('data-poll', 'n_intervals')],
+        [State('data-version', 'data'),
+         State('current-period', 'value'),
+         State('current-period', 'options')],
+        prevent_initial_call=True
+    )
+    def refresh_dashboard(n_intervals, version, current, previous_options):
+        loaded = reload_data()
+        if loaded is None or loaded['version'] == version:
+            return (dash.no_update,) * 7
+        current_options, comparison_options = period_options(loaded)
+        was_latest = bool(previous_options) and current == previous_options[-1]['value']
+        current = current_options[-1]['value'] if was_latest and current_options else dash.no_update
+        chart_data = loaded['chart_payload'] if CLIENTSIDE_CHARTS else dash.no_update
+        return (loaded['version'], app.get_relative_path(f"/maps/{loaded['map_name']}"),
+                current_options, current, comparison_options, precinct_options(loaded), chart_data)
+
+    app.callback(
+        [Output('summary-table', 'columns'),
+         Output('summary-table', 'data')],
+        [Input('current-period', 'value'),
+         Input('comparison-period', 'value'),
+         Input('data-version', 'data')]
+    )(update_summary)
+
+    # Render the charts in the browser from the chart-data store, or fall back to the server callback
+    chart_outputs = [Output(chart_id, 'figure') for chart_id in charts.CHART_IDS]
+    if CLIENTSIDE_CHARTS:
+        app.clientside_callback(
+            ClientsideFunction(namespace='charts', function_name='render'),
+            chart_outputs,
+            [Input('precinct-dropdown', 'value'), Input('precinct-view', 'value'), Input('chart-data', 'data')]
         )
-        
-        # Melt the dataframe for SLA metrics
-        sla_melted_data = data.melt(id_vars=['bill_due_month'], 
-                                    value_vars=['Tickets', 'SLA', 'Type Access', 'Type Facilities', 'Type others'],
-                                    var_name='Metric', value_name='Percentage')
-
-        # Create a bar chart for SLA metrics with stacked percentages
-        sla_fig = go.Figure()
-
-        # Add Type Access, Type Facilities, and Type others as stacked bars on secondary y-axis
-        for metric in ['Type Access', 'Type Facilities', 'Type others']:
-            sla_fig.add_trace(
-                go.Bar(x=sla_melted_data[sla_melted_data['Metric'] == metric]['bill_due_month'],
-                       y=sla_melted_data[sla_melted_data['Metric'] == metric]['Percentage'] * 100,
-                       name=metric,
-                       yaxis='y2')
-            )
+    else:
+        app.callback(chart_outputs, [Input('precinct-dropdown', 'value'), Input('precinct-view', 'value'),
+                                     Input('data-version', 'data')])(update_charts)
 
-        # Add SLA as a line on secondary y-axis
-        sla_fig.add_trace(
-            go.Scatter(x=sla_melted_data[sla_melted_data['Metric'] == 'SLA']['bill_due_month'],
-                       y=sla_melted_data[sla_melted_data['Metric'] == 'SLA']['Percentage'] * 100,
-                       name='SLA (%)',
-                       yaxis='y2',
-                       mode='lines+markers')
-        )
+    # The loader thread starts with the first request, so it runs in the serving process rather than
+    # in a `gunicorn --preload` master, whose threads and held locks forked workers would not inherit
+    if DATA_LOADING == 'sync':
+        start_loading()
+    else:
+        app.server.before_request(start_loading)
+    return app
 
-        # Add Tickets as a line on primary y-axis, ensuring it is added last to be on top
-        sla_fig.add_trace(
-            go.Scatter(x=sla_melted_data[sla_melted_data['Metric'] == 'Tickets']['bill_due_month'],
-                       y=sla_melted_data[sla_melted_data['Metric'] == 'Tickets']['Percentage'],
-                       name='Tickets',
-                       mode='lines+markers')
-        )
 
-        # Update layout for dual y-axis and stacked bars
-        sla_fig.update_layout(
-            title='Tickets and SLA Metrics Over Time',
-            xaxis=dict(title='Bill Due Month'),
-            yaxis=dict(title='Tickets Count'),
-            yaxis2=dict(title='Percentage (%)', overlaying='y', side='right', tickformat='.1f'),
-            barmode='stack',
-            legend=dict(orientation="h", yanchor="bottom", y=1, xanchor="right", x=1)
-        )
-        
-        return combined_fig, additional_fig, contract_fig, sla_fig
-    return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+app = create_app()
+server = app.server
 
 if __name__ == '__main__':
     app.run_server(debug=True, host='0.0.0.0', port=8050)
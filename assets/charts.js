@@ -0,0 +1,88 @@
+// Clientside renderer for the precinct charts (enabled with CLIENTSIDE_CHARTS=1).
+// Builds the same figures as charts.build_figures from the chart-data store.
+(function() {
+    var ALL_PRECINCTS = '__all__';
+
+    // Values of one precinct's metric over the given month indices, null where it has no data
+    function align(series, metric, monthIdx) {
+        var byMonth = {};
+        var values = series.values[metric] || [];
+        series.months.forEach(function(m, i) { byMonth[m] = values[i]; });
+        return monthIdx.map(function(m) { return byMonth[m] === undefined ? null : byMonth[m]; });
+    }
+
+    // Sum or average the selected precincts per month, skipping missing values
+    function combine(columns, agg) {
+        return columns[0].map(function(_, j) {
+            var total = 0;
+            var count = 0;
+            columns.forEach(function(column) {
+                if (column[j] !== null) { total += column[j]; count += 1; }
+            });
+            if (count === 0) { return null; }
+            return agg === 'mean' ? total / count : total;
+        });
+    }
+
+    function makeTrace(trace, months, values, name, legendgroup) {
+        var scale = trace.scale || 1;
+        var out = {
+            type: trace.type,
+            x: months,
+            y: values.map(function(v) { return v === null ? null : v * scale; }),
+            name: name
+        };
+        if (legendgroup) { out.legendgroup = legendgroup; }
+        if (trace.yaxis) { out.yaxis = trace.yaxis; }
+        if (trace.mode) { out.mode = trace.mode; }
+        return out;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        charts: {
+            render: function(selected, view, store) {
+                var noUpdate = window.dash_clientside.no_update;
+                if (!selected || selected.length === 0 || !store) {
+                    return [noUpdate, noUpdate, noUpdate, noUpdate];
+                }
+
+                var names = typeof selected === 'string' ? [selected] : selected;
+                if (names.indexOf(ALL_PRECINCTS) !== -1) {
+                    names = Object.keys(store.precincts);
+                }
+                names = names.filter(function(name) { return store.precincts[name]; });
+
+                // Union of the months any selected precinct has data for
+                var seen = {};
+                names.forEach(function(name) {
+                    store.precincts[name].months.forEach(function(m) { seen[m] = true; });
+                });
+                var monthIdx = Object.keys(seen).map(Number).sort(function(a, b) { return a - b; });
+                var months = monthIdx.map(function(i) { return store.months[i]; });
+                var compare = view === 'compare' && names.length > 1;
+
+                return store.charts.map(function(chart) {
+                    var data = [];
+                    if (compare) {
+                        names.forEach(function(name) {
+                            chart.traces.forEach(function(trace) {
+                                var values = align(store.precincts[name], trace.metric, monthIdx);
+                                var label = (trace.name || trace.metric) + ' (' + name + ')';
+                                data.push(makeTrace(trace, months, values, label, name));
+                            });
+                        });
+                    } else {
+                        chart.traces.forEach(function(trace) {
+                            var columns = names.map(function(name) {
+                                return align(store.precincts[name], trace.metric, monthIdx);
+                            });
+                            var values = columns.length ? combine(columns, store.aggregation[trace.metric]) : [];
+                            data.push(makeTrace(trace, months, values, trace.name || trace.metric));
+                        });
+                    }
+                    return {data: data, layout: Object.assign({template: store.template}, chart.layout)};
+                });
+            }
+        }
+    });
+})();
@@ -0,0 +1,245 @@
+import argparse
+import gzip
+import inspect
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The bundled precincts come first so the dashboard's default selection exists
+REAL_PRECINCTS = ['Al Rahba 1', 'Al Rahba 2', 'Al Maha 1 Block A', 'Al Maha 2 Block A']
+
+
+def precinct_names(n):
+    return (REAL_PRECINCTS + [f'Precinct {i:05d}' for i in range(len(REAL_PRECINCTS), n)])[:n]
+
+
+# Billing data shaped like data_dict.json for n precincts over m month-ends
+def synthetic_data_dict(n_precincts, n_months, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = n_precincts * n_months
+    names = np.repeat(precinct_names(n_precincts), n_months)
+    months = np.tile(np.array([f'{d:%Y-%m-%d}' for d in _month_ends(n_months)]), n_precincts)
+    units = np.repeat(rng.integers(50, 300, n_precincts), n_months)
+    billed = rng.uniform(2e5, 1.2e6, rows)
+    received = billed * rng.uniform(0.6, 1.0, rows)
+    active = (units * rng.uniform(0.7, 1.0, rows)).astype(int)
+    expiring = rng.integers(0, 20, rows)
+    renewed = (expiring * rng.uniform(0.5, 1.0, rows)).astype(int)
+    service, rent = rng.uniform(0.3, 0.4, rows), rng.uniform(0.5, 0.6, rows)
+    access = rng.uniform(0.6, 0.8, rows)
+    price = np.repeat(rng.uniform(8e5, 1.5e6, n_precincts), n_months)
+    return {
+        'bill_due_month': months.tolist(),
+        'Billed': billed.tolist(),
+        'Received': received.tolist(),
+        'Balance': (billed - received).tolist(),
+        'precinct_alternative_name': names.tolist(),
+        'Precinct Name': names.tolist(),
+        'Units': units.tolist(),
+        'Average Price': price.tolist(),
+        'Total Unit price': (price * units).tolist(),
+        'Rental Yield': rng.uniform(0.04, 0.07, rows).tolist(),
+        'Active': active.tolist(),
+        'Inactive': (units - active).tolist(),
+        'Rental': rng.uniform(0.8, 1.0, rows).tolist(),
+        'Managed': np.ones(rows, dtype=int).tolist(),
+        'Service charge': service.tolist(),
+        'Rent': rent.tolist(),
+        'Misc.': (1 - service - rent).tolist(),
+        'Min return': (billed * 0.8).tolist(),
+        'Contracts expiring': expiring.tolist(),
+        'Renewal Rate': rng.uniform(0.7, 1.0, rows).tolist(),
+        'Renewed': renewed.tolist(),
+        'Expired': (expiring - renewed).tolist(),
+        'Units rent delayed': rng.integers(0, 10, rows).tolist(),
+        'Tickets': rng.integers(100, 500, rows).tolist(),
+        'Resolution': rng.uniform(0.9, 1.0, rows).tolist(),
+        'SLA': rng.uniform(0.95, 1.0, rows).tolist(),
+        'Type Access': access.tolist(),
+        'Type Facilities': np.full(rows, 0.2).tolist(),
+        'Type others': (0.8 - access).tolist(),
+    }
+
+
+def _month_ends(n_months):
+    import pandas as pd
+
+    return pd.date_range('2023-02-01', periods=n_months, freq='MS') - pd.Timedelta(days=1)
+
+
+# Write the OSM footprint cache and precinct boundaries for a grid of buildings,
+# buildings_per_precinct per precinct, so no network is needed
+def write_synthetic_geodata(n_precincts, buildings_per_precinct, osm_cache_dir, boundaries_path):
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    import osm_cache
+
+    side = int(np.ceil(np.sqrt(n_precincts)))
+    step, size = 0.002, 0.0003
+    buildings, precincts = [], []
+    for i, name in enumerate(precinct_names(n_precincts)):
+        x0 = 54.60 + (i % side) * step
+        y0 = 24.44 + (i // side) * step
+        precincts.append({'Precinct Name': name, 'geometry': box(x0, y0, x0 + step * 0.9, y0 + step * 0.9)})
+        for b in range(buildings_per_precinct):
+            bx = x0 + (b % 3) * size * 2
+            by = y0 + (b // 3) * size * 2
+            buildings.append({'element_type': 'way', 'osmid': len(buildings) + 1,
+                              'name': name if b == 0 else None, 'geometry': box(bx, by, bx + size, by + size)})
+
+    path = osm_cache.cache_path(osm_cache.DEFAULT_PLACE, osm_cache.DEFAULT_TAGS)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    gpd.GeoDataFrame(buildings, crs='EPSG:4326').to_file(path, driver='FlatGeobuf')
+    gpd.GeoDataFrame(precincts, crs='EPSG:4326').to_file(boundaries_path, driver='GeoJSON')
+
+
+def _percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {'mean': float(samples.mean()), 'p50': float(np.percentile(samples, 50)),
+            'p95': float(np.percentile(samples, 95)), 'max': float(samples.max())}
+
+
+# Runs inside a fresh interpreter whose environment points the app at the synthetic data
+def _measure(sample_precincts):
+    start = time.perf_counter()
+    import app_map_3
+    startup_s = time.perf_counter() - start
+
+    import instrumentation
+    import plotly
+    import summary
+
+    loaded = app_map_3.state['data']
+    stages = dict(instrumentation._stages)
+
+    start = time.perf_counter()
+    monthly = summary.monthly_aggregates(loaded['excel_data'])
+    aggregation_ms = (time.perf_counter() - start) * 1000
+    months = monthly.index.strftime('%Y-%m-%d').tolist()
+    start = time.perf_counter()
+    summary.compare(monthly, months[-1], 'rolling:3')
+    comparison_ms = (time.perf_counter() - start) * 1000
+
+    precincts = [str(name) for name in loaded['excel_cube'].precincts[:sample_precincts]]
+    # The chart builder without its figure cache
+    build_charts = inspect.unwrap(app_map_3.chart_figures)
+    cold, cached, payload, compressed = [], [], [], []
+    for name in precincts:
+        start = time.perf_counter()
+        figures = build_charts(loaded, [name], 'aggregate')
+        cold.append((time.perf_counter() - start) * 1000)
+        encoded = json.dumps(figures, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+        payload.append(len(encoded))
+        compressed.append(len(gzip.compress(encoded)))
+
+        app_map_3.update_charts([name], 'aggregate')
+        start = time.perf_counter()
+        app_map_3.update_charts([name], 'aggregate')
+        cached.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    all_figures = build_charts(loaded, [app_map_3.charts.ALL_PRECINCTS], 'aggregate')
+    all_precincts_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        'rows': int(len(loaded['excel_data'])),
+        'startup_s': startup_s,
+        'startup_stages_s': stages,
+        'summary_aggregation_ms': aggregation_ms,
+        'summary_comparison_ms': comparison_ms,
+        'update_charts_ms': _percentiles(cold),
+        'update_charts_cached_ms': _percentiles(cached),
+        'update_charts_all_precincts_ms': all_precincts_ms,
+        'figure_payload_bytes': _percentiles(payload),
+        'figure_payload_gzip_bytes': _percentiles(compressed),
+        'figure_payload_all_precincts_bytes': len(json.dumps(all_figures, cls=plotly.utils.PlotlyJSONEncoder)),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+# Generate one dataset and measure it in a subprocess, so every run starts from a cold import
+def run_case(n_precincts, n_months, buildings_per_precinct, sample_precincts):
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'data_dict.json')
+        with open(data_path, 'w', encoding='utf-8') as f:
+            json.dump(synthetic_data_dict(n_precincts, n_months), f)
+
+        env = dict(
+            os.environ,
+            OSM_OFFLINE='1',
+            OSM_CACHE_DIR=os.path.join(tmp, 'osm'),
+            BILLING_DATA_PATH=data_path,
+            BILLING_CACHE_DIR=os.path.join(tmp, 'billing'),
+            MAP_CACHE_DIR=os.path.join(tmp, 'maps'),
+            SPATIAL_CACHE_DIR=os.path.join(tmp, 'spatial'),
+            PRECINCT_BOUNDARIES_PATH=os.path.join(tmp, 'precincts.geojson'),
+            DATA_LOADING='sync',
+            APP_METRICS='1',
+        )
+        env.pop('FIGURE_CACHE_DIR', None)
+        env.pop('CLIENTSIDE_CHARTS', None)
+
+        setup = [sys.executable, __file__, '_geodata', str(n_precincts), str(buildings_per_precinct)]
+        subprocess.run(setup, env=env, cwd=BASE_DIR, check=True)
+        measure = [sys.executable, __file__, '_measure', str(sample_precincts)]
+        # Only stdout carries the result; stderr stays attached so a failing run shows its traceback
+        output = subprocess.run(measure, env=env, cwd=BASE_DIR, check=True, stdout=subprocess.PIPE, text=True).stdout
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result.update({'precincts': n_precincts, 'months': n_months, 'buildings': n_precincts * buildings_per_precinct})
+    return result
+
+
+def _parse_size(value):
+    precincts, _, months = value.partition('x')
+    return int(precincts), int(months)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Internal steps run in the per-case subprocesses
+    if argv and argv[0] == '_geodata':
+        write_synthetic_geodata(int(argv[1]), int(argv[2]), os.environ['OSM_CACHE_DIR'],
+                                os.environ['PRECINCT_BOUNDARIES_PATH'])
+        return
+    if argv and argv[0] == '_measure':
+        print(json.dumps(_measure(int(argv[1]))))
+        return
+
+    parser = argparse.ArgumentParser(description='Benchmark dashboard startup, aggregation and callbacks '
+                                                 'on synthetic data')
+    parser.add_argument('--sizes', nargs='+', type=_parse_size, default=[(4, 12), (100, 36), (1000, 50)],
+                        help='Dataset sizes as PRECINCTSxMONTHS (default: 4x12 100x36 1000x50)')
+    parser.add_argument('--buildings', type=int, default=1, help='Buildings per precinct')
+    parser.add_argument('--sample', type=int, default=20, help='Precincts to time update_charts on')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_precincts, n_months in args.sizes:
+        result = run_case(n_precincts, n_months, args.buildings, args.sample)
+        print(f"{n_precincts}x{n_months}: startup {result['startup_s']:.2f}s, "
+              f"update_charts p50 {result['update_charts_ms']['p50']:.1f}ms, "
+              f"peak RSS {result['peak_rss_mb']:.0f}MB", file=sys.stderr)
+        results.append(result)
+
+    report = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
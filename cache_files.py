@@ -0,0 +1,38 @@
+import os
+import threading
+
+
+# Write `path` by calling write(tmp_path) and moving the finished file into place,
+# so other threads and workers never read a half-written file
+def atomic_write(path, write):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_text(path, text):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    atomic_write(path, write)
+
+
+# Delete the files in `directory` named prefix*suffix except the names in `keep`; returns how many
+# were deleted. Another worker may be pruning the same files, so missing ones are skipped.
+def prune(directory, prefix, suffix, keep):
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix) and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
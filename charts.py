@@ -0,0 +1,288 @@
+import json
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from summary import METRIC_SPECS
+
+# Legend shown above the dual-axis charts
+TOP_LEGEND = dict(orientation="h", yanchor="bottom", y=1, xanchor="right", x=1)
+
+# The four dashboard charts. Each trace plots one cube metric, optionally scaled
+# (ratios are shown as percentages) and placed on the secondary y-axis.
+# Both the server callback and the clientside renderer build figures from this list.
+CHART_SPECS = [
+    {
+        'id': 'combined-chart',
+        'traces': [
+            {'type': 'bar', 'metric': 'Billed'},
+            {'type': 'bar', 'metric': 'Received'},
+            {'type': 'bar', 'metric': 'Balance'},
+            # Rental Yield as a line on the secondary y-axis
+            {'type': 'scatter', 'metric': 'Rental Yield', 'name': 'Rental Yield (%)', 'scale': 100,
+             'yaxis': 'y2', 'mode': 'lines+markers'},
+        ],
+        'layout': dict(
+            title='Billed, Received, Balance, and Rental Yield Over Time',
+            xaxis=dict(title='Bill Due Month'),
+            yaxis=dict(title='Amount'),
+            yaxis2=dict(title='Rental Yield (%)', overlaying='y', side='right', tickformat='.1f'),
+            barmode='group',
+            legend=TOP_LEGEND
+        ),
+    },
+    {
+        'id': 'additional-metrics-chart',
+        'traces': [
+            {'type': 'bar', 'metric': 'Service charge collected'},
+            {'type': 'bar', 'metric': 'Rent collected'},
+            {'type': 'bar', 'metric': 'Misc Expenses collected'},
+        ],
+        'layout': dict(
+            title='Service Charge, Rent, and Misc Expenses Collected Over Time',
+            xaxis=dict(title='bill_due_month'),
+            yaxis=dict(title='Collected Amount'),
+            legend=dict(title='Metric'),
+            barmode='group'
+        ),
+    },
+    {
+        'id': 'contract-metrics-chart',
+        'traces': [
+            {'type': 'bar', 'metric': 'Contracts expiring'},
+            {'type': 'bar', 'metric': 'Renewed'},
+            {'type': 'bar', 'metric': 'Expired'},
+            {'type': 'bar', 'metric': 'Units rent delayed'},
+            # Renewal Rate as a line on the secondary y-axis
+            {'type': 'scatter', 'metric': 'Renewal Rate', 'name': 'Renewal Rate (%)', 'scale': 100,
+             'yaxis': 'y2', 'mode': 'lines+markers'},
+        ],
+        'layout': dict(
+            title='Contract Metrics Over Time',
+            xaxis=dict(title='Bill Due Month'),
+            yaxis=dict(title='Count'),
+            yaxis2=dict(title='Renewal Rate (%)', overlaying='y', side='right', tickformat='.1f'),
+            barmode='group',
+            legend=TOP_LEGEND
+        ),
+    },
+    {
+        'id': 'sla-chart',
+        'traces': [
+            # Ticket types as stacked percentage bars on the secondary y-axis
+            {'type': 'bar', 'metric': 'Type Access', 'scale': 100, 'yaxis': 'y2'},
+            {'type': 'bar', 'metric': 'Type Facilities', 'scale': 100, 'yaxis': 'y2'},
+            {'type': 'bar', 'metric': 'Type others', 'scale': 100, 'yaxis': 'y2'},
+            {'type': 'scatter', 'metric': 'SLA', 'name': 'SLA (%)', 'scale': 100, 'yaxis': 'y2',
+             'mode': 'lines+markers'},
+            # Tickets last on the primary y-axis so it is drawn on top
+            {'type': 'scatter', 'metric': 'Tickets', 'mode': 'lines+markers'},
+        ],
+        'layout': dict(
+            title='Tickets and SLA Metrics Over Time',
+            xaxis=dict(title='Bill Due Month'),
+            yaxis=dict(title='Tickets Count'),
+            yaxis2=dict(title='Percentage (%)', overlaying='y', side='right', tickformat='.1f'),
+            barmode='stack',
+            legend=TOP_LEGEND
+        ),
+    },
+]
+
+CHART_IDS = [spec['id'] for spec in CHART_SPECS]
+
+# Every cube metric the charts plot
+CHART_METRICS = list(dict.fromkeys(trace['metric'] for spec in CHART_SPECS for trace in spec['traces']))
+
+# How each chart metric combines across precincts: the summary table's aggregation, else a sum
+CHART_AGGREGATION = {metric: METRIC_SPECS['agg'].get(metric, 'sum') for metric in CHART_METRICS}
+
+# Dropdown value standing for every precinct
+ALL_PRECINCTS = '__all__'
+
+# Precinct views: one combined series per metric, or one series per metric and precinct
+VIEW_MODES = {'aggregate': 'Combined', 'compare': 'Side by side'}
+
+# Payload-optimised figures for the server callback: the month names are sent once per chart for
+# the plotted points only, long series are downsampled to FIGURE_MAX_POINTS, the axis is labelled
+# with at most FIGURE_MAX_TICKS months and values are rounded
+COMPACT_FIGURES = os.environ.get('COMPACT_FIGURES', '').lower() in ('1', 'true', 'yes')
+FIGURE_MAX_POINTS = int(os.environ.get('FIGURE_MAX_POINTS', 500))
+FIGURE_MAX_TICKS = int(os.environ.get('FIGURE_MAX_TICKS', 12))
+FIGURE_SIGNIFICANT_DIGITS = int(os.environ.get('FIGURE_SIGNIFICANT_DIGITS', 7))
+
+
+def _trace(trace, months, series, name, **options):
+    values = series[trace['metric']]
+    if 'scale' in trace:
+        values = values * trace['scale']
+    options.update({key: trace[key] for key in ('yaxis', 'mode') if key in trace})
+    trace_type = go.Bar if trace['type'] == 'bar' else go.Scatter
+    return trace_type(x=months, y=values, name=name, **options)
+
+
+# Build one chart's figure from a precinct's months and metric series
+def build_figure(spec, months, series):
+    fig = go.Figure()
+    for trace in spec['traces']:
+        fig.add_trace(_trace(trace, months, series, trace.get('name', trace['metric'])))
+    fig.update_layout(**spec['layout'])
+    return fig
+
+
+# Build one chart's figure with every trace repeated per precinct, grouped in the legend by precinct
+def build_comparison_figure(spec, months, precinct_series):
+    fig = go.Figure()
+    for precinct, series in precinct_series:
+        for trace in spec['traces']:
+            name = f"{trace.get('name', trace['metric'])} ({precinct})"
+            fig.add_trace(_trace(trace, months, series, name, legendgroup=str(precinct)))
+    fig.update_layout(**spec['layout'])
+    return fig
+
+
+# Slice the series of a selection of precincts out of the cube: one combined dict of
+# metric -> values, or for the side-by-side view a list of (precinct, dict) pairs
+def select_series(cube, precincts, view='aggregate'):
+    if ALL_PRECINCTS in precincts:
+        precincts = list(cube.precincts)
+    if view == 'compare' and len(precincts) > 1:
+        return cube.compare(precincts)
+    return cube.aggregate(precincts, CHART_AGGREGATION)
+
+
+# Build all four figures from select_series() output.
+# The work grows with the traces drawn, not with the rows stored.
+def build_figures(months, series):
+    if COMPACT_FIGURES:
+        return tuple(compact_figure(spec, months, series) for spec in CHART_SPECS)
+    if isinstance(series, list):
+        return tuple(build_comparison_figure(spec, months, series) for spec in CHART_SPECS)
+    return tuple(build_figure(spec, months, series) for spec in CHART_SPECS)
+
+
+# Largest-Triangle-Three-Buckets: positions of at most `threshold` points that keep the shape of the series
+def lttb(values, threshold):
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(values, dtype=float))
+    # The first and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = [0]
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = (edges[i + 1] + edges[i + 2] - 1) / 2
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = n - 1, y[n - 1]
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's average
+        a = keep[-1]
+        x = np.arange(start, end)
+        area = np.abs((a - next_x) * (y[start:end] - y[a]) - (a - x) * (next_y - y[a]))
+        keep.append(start + int(area.argmax()))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def _rounded(values):
+    return [None if np.isnan(value) else float(f'{value:.{FIGURE_SIGNIFICANT_DIGITS}g}') for value in values]
+
+
+def _compact_trace(trace, positions, series, name, **options):
+    values = series[trace['metric']][positions]
+    if 'scale' in trace:
+        values = values * trace['scale']
+    out = {'type': trace['type'], 'name': name, 'y': _rounded(values)}
+    if len(positions) and positions[-1] == len(positions) - 1:
+        # Not downsampled: the x positions are implied
+        out.update(x0=0, dx=1)
+    else:
+        out['x'] = positions.tolist()
+    out.update(options)
+    out.update({key: trace[key] for key in ('yaxis', 'mode') if key in trace})
+    return out
+
+
+# Build one chart as a plain figure dict for the compact payload mode.
+# The traces are plotted against month positions. Only the plotted positions get a month name, as
+# axis label aliases that Plotly also uses for the hover labels, and at most FIGURE_MAX_TICKS of them
+# are ticks. Every trace of a precinct keeps the same months, picked by LTTB on its first trace,
+# so grouped bars stay aligned.
+def compact_figure(spec, months, series):
+    pairs = series if isinstance(series, list) else [(None, series)]
+    data = []
+    kept = set()
+    for precinct, values in pairs:
+        positions = lttb(values[spec['traces'][0]['metric']], FIGURE_MAX_POINTS)
+        kept.update(positions.tolist())
+        for trace in spec['traces']:
+            name = trace.get('name', trace['metric'])
+            if precinct is None:
+                data.append(_compact_trace(trace, positions, values, name))
+            else:
+                data.append(_compact_trace(trace, positions, values, f'{name} ({precinct})',
+                                           legendgroup=str(precinct)))
+
+    kept = sorted(kept)
+    labels = dict(zip(kept, months[kept].strftime('%b %Y')))
+    tickvals = kept[::-(-len(kept) // FIGURE_MAX_TICKS)] if kept else []
+    layout = dict(COMPACT_LAYOUTS[spec['id']], template=COMPACT_TEMPLATE)
+    layout['xaxis'] = dict(layout.get('xaxis', {}), type='linear', tickmode='array', tickvals=tickvals,
+                           ticktext=[labels[position] for position in tickvals], hoverformat='d',
+                           labelalias={str(position): label for position, label in labels.items()})
+    return {'data': data, 'layout': layout}
+
+
+# Each chart's layout as Plotly serializes it, without the template
+def _layouts():
+    layouts = [json.loads(go.Figure(layout=spec['layout']).to_json())['layout'] for spec in CHART_SPECS]
+    for layout in layouts:
+        layout.pop('template', None)
+    return layouts
+
+
+COMPACT_LAYOUTS = {spec['id']: layout for spec, layout in zip(CHART_SPECS, _layouts())}
+
+# The default template with only the trace types and layout settings the charts use;
+# the full template is most of a small figure's payload
+COMPACT_TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+COMPACT_TEMPLATE['data'] = {
+    trace_type: COMPACT_TEMPLATE['data'][trace_type]
+    for trace_type in {trace['type'] for spec in CHART_SPECS for trace in spec['traces']}
+}
+COMPACT_TEMPLATE['layout'] = {key: value for key, value in COMPACT_TEMPLATE['layout'].items()
+                              if key not in ('colorscale', 'coloraxis', 'geo', 'mapbox', 'polar', 'scene',
+                                             'ternary', 'shapedefaults', 'annotationdefaults')}
+
+
+def _column(values):
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+# Payload for the clientside renderer: the chart specs, the shared Plotly template
+# and each precinct's series as columnar arrays indexed into one list of months
+def clientside_payload(cube):
+    layouts = _layouts()
+    template = json.loads(go.Figure().to_json())['layout'].get('template')
+
+    metric_idx = cube.metrics.get_indexer(CHART_METRICS)
+    precincts = {}
+    for p, name in enumerate(cube.precincts):
+        mask = cube.present[p]
+        block = cube.values[p][mask][:, metric_idx]
+        precincts[str(name)] = {
+            'months': np.flatnonzero(mask).tolist(),
+            'values': {metric: _column(block[:, k]) for k, metric in enumerate(CHART_METRICS)},
+        }
+
+    return {
+        'months': cube.months.strftime('%Y-%m-%d').tolist(),
+        'precincts': precincts,
+        'charts': [{'traces': spec['traces'], 'layout': layout} for spec, layout in zip(CHART_SPECS, layouts)],
+        'template': template,
+        'aggregation': CHART_AGGREGATION,
+    }
@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import requests
+
+from cache_files import atomic_write, prune
+import fetch
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The billing data ships next to the app; BILLING_DATA_PATH points at another copy
+DEFAULT_DATA_PATH = os.path.join(BASE_DIR, 'data_dict.json')
+
+# Parsed data is kept as Parquet, one file per content hash of the source file
+CACHE_DIR = os.environ.get('BILLING_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'billing'))
+
+# Column types in the partitioned store: counts as 32-bit integers, ratios as 32-bit floats.
+# Money amounts and unknown numeric columns stay float64.
+STORE_DTYPES = {
+    'Units': 'Int32', 'Active': 'Int32', 'Inactive': 'Int32', 'Managed': 'Int32',
+    'Contracts expiring': 'Int32', 'Renewed': 'Int32', 'Expired': 'Int32',
+    'Units rent delayed': 'Int32', 'Tickets': 'Int32',
+    'Rental Yield': 'float32', 'Rental': 'float32', 'Service charge': 'float32', 'Rent': 'float32',
+    'Misc.': 'float32', 'Renewal Rate': 'float32', 'Resolution': 'float32', 'SLA': 'float32',
+    'Type Access': 'float32', 'Type Facilities': 'float32', 'Type others': 'float32',
+}
+
+# Partition column of the store, one directory per billing month
+PARTITION_COLUMN = 'bill_month'
+
+# Columns the dashboard reads; a source file without them is rejected
+REQUIRED_COLUMNS = [
+    'Precinct Name', 'bill_due_month', 'Billed', 'Received', 'Balance', 'Service charge', 'Rent', 'Misc.',
+    'Units', 'Average Price', 'Active', 'Inactive', 'Rental Yield', 'Contracts expiring', 'Renewal Rate',
+    'Renewed', 'Expired', 'Units rent delayed', 'Tickets', 'SLA', 'Type Access', 'Type Facilities',
+    'Type others'
+]
+
+# Seconds between checks of BILLING_DATA_URL for a newer file, per process
+REMOTE_CHECK_SECONDS = float(os.environ.get('DATA_RELOAD_SECONDS', 60))
+
+_lock = threading.Lock()
+_state = {'path': None, 'mtime': None, 'version': None, 'data': None}
+_remote_checked = {}
+
+
+# The billing data source: a local copy of BILLING_DATA_URL when set, else BILLING_DATA_PATH.
+# With check_remote=False an existing local copy is used without asking the server.
+def data_path(check_remote=True):
+    url = os.environ.get('BILLING_DATA_URL')
+    if url:
+        return fetch_remote(url, check_remote)
+    return os.environ.get('BILLING_DATA_PATH', DEFAULT_DATA_PATH)
+
+
+# Download a remote data_dict.json style file into the cache, skipping the download when it is
+# unchanged. The server is asked at most once per REMOTE_CHECK_SECONDS; if it cannot be reached,
+# the copy downloaded earlier is used.
+def fetch_remote(url, check=True):
+    path = os.path.join(CACHE_DIR, f"remote_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.json")
+    last_checked = _remote_checked.get(url)
+    if os.path.exists(path):
+        if not check or (last_checked is not None and time.monotonic() - last_checked < REMOTE_CHECK_SECONDS):
+            return path
+    _remote_checked[url] = time.monotonic()
+    try:
+        fetch.download(url, path)
+    except requests.RequestException:
+        if not os.path.exists(path):
+            raise
+        logger.warning('Fetching %s failed; using the copy downloaded earlier', url, exc_info=True)
+    return path
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Check the decoded JSON has the shape of data_dict.json: equal-length lists per column
+def validate(data_dict):
+    if not isinstance(data_dict, dict):
+        raise ValueError('Billing data must be a JSON object of column lists')
+    missing = [column for column in REQUIRED_COLUMNS if column not in data_dict]
+    if missing:
+        raise ValueError(f'Billing data is missing columns: {missing}')
+    lengths = {len(values) for values in data_dict.values()}
+    if len(lengths) != 1:
+        raise ValueError('Billing data columns have different lengths')
+
+
+# Decode, validate and type the JSON source
+def _parse(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data_dict = json.load(f)
+    validate(data_dict)
+    data = pd.DataFrame(data_dict)
+    data['bill_due_month'] = pd.to_datetime(data['bill_due_month'])
+    return data
+
+
+def _version_file(version):
+    return f'billing_{version[:16]}.parquet'
+
+
+def _load_version(path, version):
+    parquet_path = os.path.join(CACHE_DIR, _version_file(version))
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+
+    data = _parse(path)
+    atomic_write(parquet_path, lambda tmp_path: data.to_parquet(tmp_path, index=False))
+    return data
+
+
+# Delete the parsed copies of every billing data version except `keep_versions`
+def prune_cache(keep_versions):
+    keep = {_version_file(version) for version in keep_versions if version}
+    return prune(CACHE_DIR, 'billing_', '.parquet', keep)
+
+
+# Type a chunk of billing records for the store
+def normalize_chunk(chunk):
+    chunk = chunk.copy()
+    chunk['bill_due_month'] = pd.to_datetime(chunk['bill_due_month'])
+    for column in chunk.columns:
+        if column in STORE_DTYPES:
+            chunk[column] = chunk[column].astype(STORE_DTYPES[column])
+        elif pd.api.types.is_numeric_dtype(chunk[column]):
+            chunk[column] = chunk[column].astype('float64')
+        elif column != 'bill_due_month':
+            chunk[column] = chunk[column].astype(object)
+    chunk[PARTITION_COLUMN] = chunk['bill_due_month'].dt.strftime('%Y-%m')
+    return chunk
+
+
+# Yield DataFrame chunks from a JSON Lines, CSV, Parquet or data_dict.json style file
+def iter_chunks(source, chunksize=50000):
+    ext = os.path.splitext(source)[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        yield from pd.read_json(source, lines=True, chunksize=chunksize)
+    elif ext == '.csv':
+        yield from pd.read_csv(source, chunksize=chunksize)
+    elif ext == '.parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif ext == '.json':
+        # A column-oriented data_dict.json cannot be streamed; split it after decoding
+        data = _parse(source)
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start + chunksize]
+    else:
+        raise ValueError(f'Unsupported billing data format: {source}')
+
+
+# Append billing records to a month-partitioned Parquet store, one chunk at a time.
+# Ingestion only appends: loading the same records twice stores them twice.
+def ingest(source, store_dir, chunksize=50000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    for chunk in iter_chunks(source, chunksize):
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+        if missing:
+            raise ValueError(f'Billing data is missing columns: {missing}')
+        table = pa.Table.from_pandas(normalize_chunk(chunk), preserve_index=False)
+        pq.write_to_dataset(table, store_dir, partition_cols=[PARTITION_COLUMN],
+                            basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet')
+        rows += len(chunk)
+    return rows
+
+
+# Months held in a store, oldest first
+def store_months(store_dir):
+    prefix = f'{PARTITION_COLUMN}='
+    return sorted(name[len(prefix):] for name in os.listdir(store_dir) if name.startswith(prefix))
+
+
+# Read billing records from a store, limited to some columns and months
+def read_store(store_dir, columns=None, months=None):
+    filters = [(PARTITION_COLUMN, 'in', list(months))] if months is not None else None
+    data = pd.read_parquet(store_dir, columns=columns, filters=filters)
+    data = data.drop(columns=[PARTITION_COLUMN], errors='ignore')
+    data['Precinct Name'] = data['Precinct Name'].astype('category')
+    return data.sort_values(['bill_due_month', 'Precinct Name']).reset_index(drop=True)
+
+
+def _store_signature(store_dir):
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(store_dir)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f'{os.path.relpath(os.path.join(root, name), store_dir)}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Load the dashboard columns from a store. BILLING_HISTORY_MONTHS limits it to the latest months
+# so memory stays bounded as history grows.
+def _load_store(store_dir):
+    months = None
+    history = os.environ.get('BILLING_HISTORY_MONTHS')
+    if history:
+        months = store_months(store_dir)[-int(history):]
+    return read_store(store_dir, columns=REQUIRED_COLUMNS, months=months)
+
+
+# Return the billing DataFrame, re-reading the source only when it changes.
+# The source is either a data_dict.json style file or a store directory written by ingest().
+def load_billing_data(path=None, check_remote=True):
+    path = path or data_path(check_remote)
+    with _lock:
+        if os.path.isdir(path):
+            version = _store_signature(path)
+            if _state['path'] != path or _state['version'] != version:
+                _state['data'] = _load_store(path)
+                _state['version'] = version
+            _state['path'] = path
+            _state['mtime'] = None
+            return _state['data']
+
+        mtime = os.stat(path).st_mtime_ns
+        if _state['path'] == path and _state['mtime'] == mtime:
+            return _state['data']
+
+        version = _file_hash(path)
+        if _state['path'] != path or _state['version'] != version:
+            _state['data'] = _load_version(path, version)
+            _state['version'] = version
+        _state['path'] = path
+        _state['mtime'] = mtime
+        return _state['data']
+
+
+# Content hash of the currently loaded billing data
+def data_version():
+    return _state['version']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the billing data store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Append billing records to a partitioned store')
+    ingest_parser.add_argument('source', help='JSON Lines, CSV, Parquet or data_dict.json file')
+    ingest_parser.add_argument('store', help='Store directory (point BILLING_DATA_PATH at it)')
+    ingest_parser.add_argument('--chunksize', type=int, default=50000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'ingest':
+        rows = ingest(args.source, args.store, args.chunksize)
+        print(f'Appended {rows} rows to {args.store}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache_files import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection and then for each read of a response
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 30))
+
+# Retries per request, waiting FETCH_BACKOFF * 2**n seconds between attempts
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 4))
+FETCH_BACKOFF = float(os.environ.get('FETCH_BACKOFF', 0.5))
+
+# Fetches running at once, which is also the number of pooled connections per host
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 8))
+
+# Responses worth retrying; anything else fails straight away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _session():
+    retry = Retry(total=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=['GET', 'HEAD'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# One session per process so every fetch reuses the pooled connections
+session = _session()
+
+
+# Forked workers (gunicorn --preload) must not share the parent's open connections
+def _reset_session():
+    global session
+    session = _session()
+
+
+os.register_at_fork(after_in_child=_reset_session)
+
+
+# Run fn(*args), retrying with exponential backoff and jitter when it raises one of `errors`
+def with_backoff(fn, *args, errors=(requests.RequestException,), retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except errors:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            logger.warning('%s failed; retrying in %.1f seconds', getattr(fn, '__name__', fn), delay, exc_info=True)
+            time.sleep(delay)
+
+
+# Run several zero-argument calls concurrently and return their results in order,
+# so the total time is that of the slowest call rather than the sum
+def run_all(calls):
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(calls)) or 1, thread_name_prefix='fetch') as executor:
+        futures = [executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+
+def _meta_path(path):
+    return f'{path}.meta.json'
+
+
+# Download url to path unless the copy there is still current. The ETag and Last-Modified headers
+# of the last download are kept next to the file and sent back as If-None-Match/If-Modified-Since,
+# so an unchanged resource costs one 304 response. Returns True when the file was (re)written.
+def download(url, path):
+    headers = {}
+    if os.path.exists(path) and os.path.exists(_meta_path(path)):
+        with open(_meta_path(path), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('url') == url:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+    with session.get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                for block in response.iter_content(1 << 20):
+                    f.write(block)
+        atomic_write(path, write)
+
+        meta = {'url': url, 'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+    with open(_meta_path(path), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return True
@@ -0,0 +1,109 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import dash
+import plotly.io as pio
+
+from cache_files import atomic_write_text
+import instrumentation
+
+
+# Bounded LRU cache of serialized figure JSON.
+# With a directory the entries live on disk and are shared by every worker on the host;
+# otherwise they are kept in this process only.
+class FigureCache:
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json')
+
+    def get(self, key):
+        with self._lock:
+            if self.directory:
+                value = self._disk_get(key)
+            else:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if self.directory:
+                self._disk_set(key, value)
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            # Touch the file so its mtime tracks the last use for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _disk_set(self, key, value):
+        atomic_write_text(self._path(key), value)
+
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        if len(entries) > self.maxsize:
+            entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+            for entry in entries[:len(entries) - self.maxsize]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        if self.directory:
+            size = sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+        else:
+            size = len(self._entries)
+        return {'hits': self.hits, 'misses': self.misses, 'size': size, 'maxsize': self.maxsize}
+
+
+# Memoize a function returning a tuple of figures under key(*args), which must identify both
+# the selection and the version of the data the figures are built from.
+# Cache hits return the stored figure dicts without running the function.
+# The function may return go.Figure objects or plain figure dicts.
+def cached_figures(cache, key):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key_json = json.dumps(key(*args), sort_keys=True, default=str)
+            value = cache.get(key_json)
+            if value is not None:
+                return tuple(json.loads(value))
+
+            figures = func(*args)
+            if any(figure is dash.no_update for figure in figures):
+                return figures
+            with instrumentation.timed('app_callback_seconds', callback=func.__name__, phase='serialize'):
+                value = '[' + ','.join(pio.to_json(figure, validate=False) for figure in figures) + ']'
+            cache.set(key_json, value)
+            return figures
+        return wrapper
+    return decorator
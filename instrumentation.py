@@ -0,0 +1,130 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# Timings are only kept and /metrics only served when APP_METRICS is set
+ENABLED = os.environ.get('APP_METRICS', '').lower() in ('1', 'true', 'yes')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_stages = OrderedDict()
+_histograms = OrderedDict()
+_gauge_sources = OrderedDict()
+
+
+def record_stage(name, seconds):
+    if ENABLED:
+        with _lock:
+            _stages[name] = seconds
+
+
+# Record how long one startup stage takes
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def observe(metric, seconds, **labels):
+    if not ENABLED:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+# Time a block of code into a latency histogram
+@contextmanager
+def timed(metric, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - start, **labels)
+
+
+# Time every call of a Dash callback as its 'total' phase
+def timed_callback(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            with timed('app_callback_seconds', callback=name, phase='total'):
+                return func(*args)
+        return wrapper
+    return decorator
+
+
+# Export the values of a function returning {name: number} as gauges named <prefix>_<name>
+def add_gauges(prefix, source):
+    _gauge_sources[prefix] = source
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+# Render all metrics in the Prometheus text exposition format
+def render():
+    lines = ['# TYPE app_startup_stage_seconds gauge']
+    with _lock:
+        for name, seconds in _stages.items():
+            lines.append(f'app_startup_stage_seconds{{stage="{name}"}} {seconds:.6f}')
+
+        typed = set()
+        for (metric, labels), histogram in _histograms.items():
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} histogram')
+                typed.add(metric)
+            for bound, count in zip(BUCKETS, histogram['buckets']):
+                lines.append(f'{metric}_bucket{_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{metric}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{metric}_sum{_labels(labels)} {histogram["sum"]:.6f}')
+            lines.append(f'{metric}_count{_labels(labels)} {histogram["count"]}')
+
+    for prefix, source in _gauge_sources.items():
+        for name, value in source().items():
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# Serve /metrics and time every request by endpoint, which includes Dash's response serialization
+def register_routes(server):
+    if not ENABLED:
+        return
+
+    @server.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = getattr(g, 'request_start', None)
+        if start is not None and request.path != '/metrics':
+            # Label by route pattern so per-file URLs do not create new series
+            path = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe('app_request_seconds', time.perf_counter() - start, path=path)
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,144 @@
+import hashlib
+import os
+
+import folium
+import numpy as np
+from branca.element import MacroElement
+from flask import send_from_directory
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
+
+from cache_files import atomic_write_text, prune
+
+# Rendered maps are written here as map_<content hash>.html
+MAP_CACHE_DIR = os.environ.get(
+    'MAP_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'maps')
+)
+
+# Columns shown in the building tooltips, with their labels
+TOOLTIP_COLUMNS = ['Precinct Name', 'Billed', 'Received', 'Balance', 'Units', 'Average Price', 'Active',
+                   'Inactive', 'Rental Yield']
+TOOLTIP_ALIASES = [f'{column}:' for column in TOOLTIP_COLUMNS]
+
+# Rendered maps never change under the same name, so browsers may keep them for a year
+MAX_AGE = 365 * 24 * 3600
+
+# How buildings are drawn: 'features' embeds one GeoJSON FeatureCollection, 'tiles' loads
+# pre-generated vector tiles from MAP_TILES_URL, 'auto' switches to tiles above MAP_TILES_THRESHOLD buildings
+MAP_LAYER_MODE = os.environ.get('MAP_LAYER_MODE', 'auto')
+MAP_TILES_URL = os.environ.get('MAP_TILES_URL')
+MAP_TILES_LAYER = os.environ.get('MAP_TILES_LAYER', 'buildings')
+MAP_TILES_THRESHOLD = int(os.environ.get('MAP_TILES_THRESHOLD', 5000))
+
+# Geometry simplification: a server-side tolerance in degrees (0 keeps the OSM outlines)
+# and Leaflet's per-zoom-level smoothing factor
+MAP_SIMPLIFY_TOLERANCE = float(os.environ.get('MAP_SIMPLIFY_TOLERANCE', 0))
+MAP_SMOOTH_FACTOR = float(os.environ.get('MAP_SMOOTH_FACTOR', 1.0))
+
+# Where the map opens when no buildings matched (Al Muneera, Abu Dhabi)
+DEFAULT_LOCATION = [24.447, 54.608]
+
+BUILDING_STYLE = {'color': '#3388ff', 'weight': 3, 'opacity': 1, 'fill': True, 'fillColor': '#3388ff',
+                  'fillOpacity': 0.2}
+
+
+def layer_mode(feature_count):
+    if MAP_LAYER_MODE == 'auto':
+        return 'tiles' if MAP_TILES_URL and feature_count > MAP_TILES_THRESHOLD else 'features'
+    return MAP_LAYER_MODE
+
+
+# Buildings with their tooltip values formatted as display strings, ready to export as a
+# FeatureCollection (also the input for generating the vector tiles)
+def building_features(merged_gdf):
+    features = merged_gdf[['geometry']].copy()
+    features['Precinct Name'] = merged_gdf['Precinct Name'].astype(str)
+    for column in TOOLTIP_COLUMNS[1:-1]:
+        features[column] = merged_gdf[column].round(1).astype(str)
+    features['Rental Yield'] = np.char.mod('%.1f%%', merged_gdf['Rental Yield'].to_numpy(dtype=float) * 100)
+    if MAP_SIMPLIFY_TOLERANCE:
+        features['geometry'] = features.geometry.simplify(MAP_SIMPLIFY_TOLERANCE, preserve_topology=True)
+    return features
+
+
+# Click popups for vector tile features, built from the same tooltip fields
+class _TilePopup(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this.layer.get_name() }}.on('click', function(e) {
+            var properties = e.layer.properties;
+            var fields = {{ this.fields|tojson }};
+            var aliases = {{ this.aliases|tojson }};
+            var html = fields.map(function(field, i) {
+                return '<b>' + aliases[i] + '</b> ' + properties[field];
+            }).join('<br>');
+            L.popup().setLatLng(e.latlng).setContent(html).openOn({{ this.map.get_name() }});
+        });
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, m):
+        super().__init__()
+        self.layer = layer
+        self.map = m
+        self.fields = TOOLTIP_COLUMNS
+        self.aliases = TOOLTIP_ALIASES
+
+
+# Create a folium map with all buildings in a single layer
+def render_map(merged_gdf):
+    if merged_gdf.empty:
+        return folium.Map(location=DEFAULT_LOCATION, zoom_start=15).get_root().render()
+
+    center = merged_gdf.geometry.unary_union.centroid
+    m = folium.Map(location=[center.y, center.x], zoom_start=17)
+
+    if layer_mode(len(merged_gdf)) == 'tiles':
+        options = {
+            'interactive': True,
+            'vectorTileLayerStyles': {MAP_TILES_LAYER: BUILDING_STYLE},
+        }
+        layer = VectorGridProtobuf(MAP_TILES_URL, MAP_TILES_LAYER, options).add_to(m)
+        m.add_child(_TilePopup(layer, m))
+    else:
+        folium.GeoJson(
+            building_features(merged_gdf).to_json(),
+            smooth_factor=MAP_SMOOTH_FACTOR,
+            tooltip=folium.GeoJsonTooltip(fields=TOOLTIP_COLUMNS, aliases=TOOLTIP_ALIASES)
+        ).add_to(m)
+
+    return m.get_root().render()
+
+
+# Hash of everything the rendered map depends on: the layer settings, geometries and tooltip metrics
+def map_key(merged_gdf):
+    digest = hashlib.sha256()
+    settings = (layer_mode(len(merged_gdf)), MAP_TILES_URL, MAP_TILES_LAYER, MAP_SIMPLIFY_TOLERANCE, MAP_SMOOTH_FACTOR)
+    digest.update(repr(settings).encode('utf-8'))
+    digest.update(merged_gdf[TOOLTIP_COLUMNS + ['geometry']].to_json().encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Render the map into the cache unless a map for the same content exists; returns its file name
+def map_asset(merged_gdf):
+    name = f'map_{map_key(merged_gdf)}.html'
+    path = os.path.join(MAP_CACHE_DIR, name)
+    if not os.path.exists(path):
+        atomic_write_text(path, render_map(merged_gdf))
+    return name
+
+
+# Delete the rendered maps except the names in `keep_names`
+def prune_maps(keep_names):
+    return prune(MAP_CACHE_DIR, 'map_', '.html', set(keep_names))
+
+
+# Serve rendered maps from the cache with long-lived cache headers and ETags
+def register_routes(server, url_prefix='/maps'):
+    @server.route(f'{url_prefix}/<name>')
+    def serve_map(name):
+        response = send_from_directory(MAP_CACHE_DIR, name, max_age=MAX_AGE, conditional=True, etag=True)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+# Metrics derived from other columns, materialized once when the cube is built
+DERIVED_METRICS = {
+    'Service charge collected': ('Billed', 'Service charge'),
+    'Rent collected': ('Billed', 'Rent'),
+    'Misc Expenses collected': ('Billed', 'Misc.'),
+}
+
+
+# Dense (precinct x month x metric) array of the billing data.
+# Months a precinct has no row for are NaN and masked out by `present`.
+class MetricCube:
+    def __init__(self, data, precinct_column='Precinct Name', month_column='bill_due_month'):
+        numeric = data.select_dtypes(include='number')
+        metrics = list(numeric.columns) + list(DERIVED_METRICS)
+
+        self.precincts = pd.Index(pd.unique(data[precinct_column]))
+        self.months = pd.DatetimeIndex(np.sort(pd.unique(data[month_column])))
+        self.metrics = pd.Index(metrics)
+
+        p_idx = self.precincts.get_indexer(data[precinct_column])
+        m_idx = self.months.get_indexer(data[month_column])
+
+        self.values = np.full((len(self.precincts), len(self.months), len(metrics)), np.nan)
+        self.values[p_idx, m_idx, :len(numeric.columns)] = numeric.to_numpy(dtype=float, na_value=np.nan)
+        for name, (left, right) in DERIVED_METRICS.items():
+            k = self.metrics.get_loc(name)
+            self.values[:, :, k] = self.values[:, :, self.metrics.get_loc(left)] * self.values[:, :, self.metrics.get_loc(right)]
+
+        self.present = np.zeros((len(self.precincts), len(self.months)), dtype=bool)
+        self.present[p_idx, m_idx] = True
+
+    # Months with data for a precinct and a dict of metric -> values over those months
+    def series(self, precinct):
+        p = self.precincts.get_indexer([precinct])[0]
+        if p < 0:
+            return self.months[:0], {metric: np.empty(0) for metric in self.metrics}
+        mask = self.present[p]
+        block = self.values[p][mask]
+        return self.months[mask], {metric: block[:, k] for k, metric in enumerate(self.metrics)}
+
+    def _select(self, precincts):
+        idx = self.precincts.get_indexer(precincts)
+        idx = idx[idx >= 0]
+        return idx, self.present[idx].any(axis=0)
+
+    # Combine several precincts into one series per metric over the months any of them has data.
+    # `how` maps metrics to 'sum' or 'mean'; metrics not listed are summed.
+    def aggregate(self, precincts, how):
+        idx, mask = self._select(precincts)
+        block = self.values[idx][:, mask]
+        counts = (~np.isnan(block)).sum(axis=0)
+        sums = np.nansum(block, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        mean_columns = self.metrics.isin([metric for metric, agg in how.items() if agg == 'mean'])
+        combined = np.where(mean_columns, means, sums)
+        combined[counts == 0] = np.nan
+        return self.months[mask], {metric: combined[:, k] for k, metric in enumerate(self.metrics)}
+
+    # Series of several precincts side by side over the months any of them has data,
+    # as a list of (precinct, dict of metric -> values); missing months are NaN
+    def compare(self, precincts):
+        idx, mask = self._select(precincts)
+        block = self.values[idx][:, mask]
+        return self.months[mask], [
+            (self.precincts[p], {metric: block[i, :, k] for k, metric in enumerate(self.metrics)})
+            for i, p in enumerate(idx)
+        ]
@@ -0,0 +1,99 @@
+import argparse
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+
+from cache_files import atomic_write
+import fetch
+
+# Place and tag set the dashboard maps by default
+DEFAULT_PLACE = 'Al Muneera, Abu Dhabi, United Arab Emirates'
+DEFAULT_TAGS = {'building': True}
+
+# Footprints are stored as FlatGeobuf files, one per (place, tags) pair
+CACHE_DIR = os.environ.get(
+    'OSM_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'osm')
+)
+
+# Columns kept from the OSM download; the rest are sparse tag columns we never read
+KEEP_COLUMNS = ['element_type', 'osmid', 'name', 'geometry']
+
+# Seconds an Overpass or Nominatim request may take, including the server-side query
+OSM_TIMEOUT = float(os.environ.get('OSM_TIMEOUT', 180))
+
+
+# Build the cache file path for a place and tag set
+def cache_path(place, tags):
+    key = json.dumps({'place': place, 'tags': tags}, sort_keys=True)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f'footprints_{digest}.fgb')
+
+
+# Download the footprints from OSM and write them to the cache
+def refresh_footprints(place=DEFAULT_PLACE, tags=DEFAULT_TAGS):
+    import osmnx as ox
+
+    ox.settings.requests_timeout = OSM_TIMEOUT
+    gdf = fetch.with_backoff(ox.features_from_place, place, tags).reset_index()
+    gdf = gdf.reindex(columns=KEEP_COLUMNS)
+    gdf['element_type'] = gdf['element_type'].astype(str)
+    gdf['osmid'] = gdf['osmid'].astype('int64')
+    gdf['name'] = gdf['name'].astype(object)
+
+    path = cache_path(place, tags)
+    atomic_write(path, lambda tmp_path: gdf.to_file(tmp_path, driver='FlatGeobuf'))
+    return path
+
+
+# Load footprints from the cache, optionally only the buildings with the given names or
+# inside a (minx, miny, maxx, maxy) bounding box, which uses the FlatGeobuf spatial index.
+# The cache is only filled from OSM when it does not exist yet, unless OSM_OFFLINE is set.
+def load_footprints(place=DEFAULT_PLACE, tags=DEFAULT_TAGS, names=None, bbox=None):
+    path = cache_path(place, tags)
+    if not os.path.exists(path):
+        if os.environ.get('OSM_OFFLINE'):
+            raise FileNotFoundError(
+                f"No cached footprints for {place!r} at {path}; run 'python osm_cache.py refresh' first"
+            )
+        refresh_footprints(place, tags)
+
+    where = None
+    if names is not None:
+        quoted = ', '.join("'" + str(name).replace("'", "''") + "'" for name in names)
+        where = f'"name" IN ({quoted})'
+    return gpd.read_file(path, where=where, bbox=bbox)
+
+
+# Refresh the footprints of several places concurrently
+def refresh_all(places, tags=DEFAULT_TAGS):
+    return fetch.run_all([lambda place=place: refresh_footprints(place, tags) for place in places])
+
+
+def _parse_tag(value):
+    key, _, tag_value = value.partition('=')
+    if tag_value in ('', 'True', 'true'):
+        return key, True
+    return key, tag_value.split(',') if ',' in tag_value else tag_value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the offline OSM footprint cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    refresh = subparsers.add_parser('refresh', help='Download footprints from OSM into the cache')
+    refresh.add_argument('places', nargs='*', default=[DEFAULT_PLACE], metavar='place')
+    refresh.add_argument('--tag', action='append', type=_parse_tag,
+                         help='OSM tag filter as key=value (default: building=True)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'refresh':
+        tags = dict(args.tag) if args.tag else DEFAULT_TAGS
+        for path in refresh_all(args.places, tags):
+            print(f'Wrote {path}')
+
+
+if __name__ == '__main__':
+    main()
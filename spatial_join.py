@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import STRtree
+from shapely.geometry import box
+
+from cache_files import atomic_write
+import osm_cache
+
+# Precinct boundary polygons or location points, with a 'Precinct Name' column.
+# Without it, precincts are matched to OSM buildings by name.
+PRECINCT_BOUNDARIES_PATH = os.environ.get('PRECINCT_BOUNDARIES_PATH')
+
+# Precinct points outside every building are assigned the nearest building within this many metres
+NEAREST_MAX_METRES = float(os.environ.get('PRECINCT_NEAREST_MAX_METRES', 50))
+
+# Computed precinct -> building mappings are cached here as Parquet
+CACHE_DIR = os.environ.get(
+    'SPATIAL_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'spatial')
+)
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+# Match buildings to precincts with an STRtree.
+# Boundary polygons claim the buildings whose representative point lies inside them;
+# location points claim the building containing them, or failing that the nearest one.
+# Returns one row per (precinct, building) as positions into `footprints`.
+def join(footprints, precincts):
+    if footprints.empty or precincts.empty:
+        return pd.DataFrame({'Precinct Name': pd.Series(dtype=object), 'footprint': pd.Series(dtype='int64')})
+
+    crs = footprints.estimate_utm_crs()
+    footprints = footprints.to_crs(crs)
+    precincts = precincts.to_crs(crs)
+    names = precincts['Precinct Name'].to_numpy()
+
+    is_point = precincts.geom_type.isin(['Point', 'MultiPoint']).to_numpy()
+    pairs = []
+
+    if (~is_point).any():
+        polygons = precincts.geometry.to_numpy()[~is_point]
+        tree = STRtree(polygons)
+        building_idx, polygon_idx = tree.query(footprints.geometry.representative_point().to_numpy(),
+                                               predicate='within')
+        # A building inside overlapping boundaries goes to the first of them
+        building_idx, first = np.unique(building_idx, return_index=True)
+        pairs.append(pd.DataFrame({'Precinct Name': names[~is_point][polygon_idx[first]],
+                                   'footprint': building_idx}))
+
+    if is_point.any():
+        points = precincts.geometry.to_numpy()[is_point]
+        tree = STRtree(footprints.geometry.to_numpy())
+        point_idx, building_idx = tree.query(points, predicate='within')
+        unmatched = np.setdiff1d(np.arange(len(points)), point_idx)
+        if len(unmatched):
+            nearest_point, nearest_building = tree.query_nearest(points[unmatched], max_distance=NEAREST_MAX_METRES)
+            point_idx = np.concatenate([point_idx, unmatched[nearest_point]])
+            building_idx = np.concatenate([building_idx, nearest_building])
+        pairs.append(pd.DataFrame({'Precinct Name': names[is_point][point_idx], 'footprint': building_idx}))
+
+    return pd.concat(pairs, ignore_index=True).drop_duplicates()
+
+
+# Bounding box of the precincts in EPSG:4326, grown by NEAREST_MAX_METRES so the buildings
+# a precinct point may fall back to are read as well
+def search_bbox(precincts):
+    crs = precincts.estimate_utm_crs()
+    area = box(*precincts.to_crs(crs).total_bounds).buffer(NEAREST_MAX_METRES)
+    return tuple(gpd.GeoSeries([area], crs=crs).to_crs('EPSG:4326').total_bounds)
+
+
+# Buildings of every precinct with its 'Precinct Name'; a precinct may have several buildings.
+# Without PRECINCT_BOUNDARIES_PATH a building belongs to the precinct it is named after: all named
+# buildings are read, or only those named in `names`.
+def precinct_footprints(place, tags, names=None):
+    if not PRECINCT_BOUNDARIES_PATH:
+        footprints = osm_cache.load_footprints(place, tags, names=names)
+        footprints = footprints[footprints['name'].notna()].copy()
+        footprints['Precinct Name'] = footprints['name']
+        return footprints
+
+    precincts = gpd.read_file(PRECINCT_BOUNDARIES_PATH)
+    # Only read the buildings around the precincts
+    bbox = search_bbox(precincts)
+    footprints = osm_cache.load_footprints(place, tags, bbox=bbox).reset_index(drop=True)
+
+    key = hashlib.sha1(
+        f'{_file_key(osm_cache.cache_path(place, tags))}|{_file_key(PRECINCT_BOUNDARIES_PATH)}|{bbox}|{NEAREST_MAX_METRES}'.encode('utf-8')
+    ).hexdigest()[:16]
+    mapping_path = os.path.join(CACHE_DIR, f'mapping_{key}.parquet')
+    if os.path.exists(mapping_path):
+        mapping = pd.read_parquet(mapping_path)
+    else:
+        mapping = join(footprints, precincts)
+        atomic_write(mapping_path, lambda tmp_path: mapping.to_parquet(tmp_path, index=False))
+
+    matched = footprints.iloc[mapping['footprint'].to_numpy()].copy()
+    matched['Precinct Name'] = mapping['Precinct Name'].to_numpy()
+    return matched.reset_index(drop=True)
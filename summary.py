@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+# One row per summary metric: how it is aggregated across precincts for a month,
+# which direction of change is good ('up', 'down' or None) and how values are displayed
+METRIC_SPECS = pd.DataFrame([
+    ('Billed', 'sum', 'up', 'number'),
+    ('Received', 'sum', 'up', 'number'),
+    ('Balance', 'sum', 'up', 'number'),
+    ('Units', 'sum', None, 'raw'),
+    ('Average Price', 'mean', None, 'number'),
+    ('Active', 'sum', 'up', 'raw'),
+    ('Inactive', 'sum', 'down', 'raw'),
+    ('Rental Yield', 'mean', 'up', 'percent'),
+    ('Contracts expiring', 'sum', 'down', 'raw'),
+    ('Renewal Rate', 'mean', 'up', 'percent'),
+    ('Renewed', 'sum', 'up', 'raw'),
+    ('Expired', 'sum', 'down', 'raw'),
+    ('Units rent delayed', 'sum', 'down', 'raw'),
+    ('Tickets', 'sum', 'down', 'raw'),
+    ('SLA', 'mean', 'up', 'percent'),
+    ('Type Access', 'mean', 'up', 'percent'),
+    ('Type Facilities', 'mean', 'up', 'percent'),
+    ('Type others', 'mean', 'up', 'percent'),
+], columns=['metric', 'agg', 'direction', 'format']).set_index('metric')
+
+# Comparison periods relative to the current month, as offered in the UI
+RELATIVE_PERIODS = {
+    'rolling:1': 'Previous month',
+    'rolling:3': 'Average of previous 3 months',
+    'rolling:12': 'Average of previous 12 months',
+}
+
+SUMMARY_COLUMNS = ['Metric', 'Current Value', 'Comparison Value', 'Variance']
+
+# Variance coloring: each row carries a precomputed 'Status' field, so the table needs just two rules
+VARIANCE_STYLES = [
+    {'if': {'filter_query': '{Status} = "good"', 'column_id': 'Variance'}, 'backgroundColor': 'green'},
+    {'if': {'filter_query': '{Status} = "bad"', 'column_id': 'Variance'}, 'backgroundColor': 'yellow'},
+]
+
+
+# Aggregate every summary metric for every month in one grouped pass
+def monthly_aggregates(data, month_column='bill_due_month'):
+    aggs = METRIC_SPECS['agg'].to_dict()
+    return data.groupby(month_column)[list(aggs)].agg(aggs).sort_index()
+
+
+# Months whose rows differ between two versions of the data, including months only one of them has
+def changed_months(old, new, month_column='bill_due_month'):
+    def fingerprints(data):
+        hashes = pd.util.hash_pandas_object(data[sorted(data.columns)], index=False).to_numpy().view('int64')
+        return pd.Series(hashes).groupby(data[month_column].to_numpy()).sum()
+
+    old_fp, new_fp = fingerprints(old), fingerprints(new)
+    common = old_fp.index.intersection(new_fp.index)
+    differ = common[old_fp[common].to_numpy() != new_fp[common].to_numpy()]
+    return old_fp.index.symmetric_difference(new_fp.index).union(differ)
+
+
+# Update monthly_aggregates() output from `old` to `new` data, aggregating only the changed months
+def update_aggregates(monthly, old, new, month_column='bill_due_month'):
+    changed = changed_months(old, new, month_column)
+    fresh = monthly_aggregates(new[new[month_column].isin(changed)], month_column)
+    return pd.concat([monthly.loc[~monthly.index.isin(changed)], fresh]).sort_index()
+
+
+def _month_label(month):
+    return f'{month:%B %Y}'
+
+
+# Resolve a period selector to a display label and one value per metric.
+# A selector is either a month ('2023-11-30') or 'rolling:N', the mean of the
+# N months before `current`.
+def period_values(monthly, selector, current=None):
+    if selector.startswith('rolling:'):
+        window = int(selector.split(':', 1)[1])
+        previous = monthly.loc[monthly.index < pd.Timestamp(current)].tail(window)
+        if window == 1:
+            if len(previous):
+                return _month_label(previous.index[0]), previous.iloc[0]
+            return 'Previous month', pd.Series(np.nan, index=monthly.columns)
+        return f'Previous {window}-month average', previous.mean()
+
+    month = pd.Timestamp(selector)
+    if month not in monthly.index:
+        return _month_label(month), pd.Series(np.nan, index=monthly.columns)
+    return _month_label(month), monthly.loc[month]
+
+
+# Display values per metric format; 'raw' values are passed through unchanged and missing ones shown as N/A
+def format_values(values):
+    formats = METRIC_SPECS['format'].reindex(values.index).to_numpy()
+    numbers = values.to_numpy(dtype=float)
+    out = values.to_numpy(dtype=object, copy=True)
+    for fmt, template, scale in (('number', '%.1f', 1), ('percent', '%.1f%%', 100)):
+        mask = formats == fmt
+        out[mask] = np.char.mod(template, numbers[mask] * scale).tolist()
+    out[np.isnan(numbers)] = 'N/A'
+    return out
+
+
+# 'good' when a metric moved in its good direction ('up' needs a positive variance, 'down' a
+# non-positive one), 'bad' otherwise, and '' for metrics without a direction or variance
+def variance_status(metrics, variance):
+    direction = METRIC_SPECS['direction'].reindex(metrics).to_numpy()
+    rising = variance > 0
+    good = np.where(direction == 'up', rising, ~rising)
+    status = np.where(good, 'good', 'bad').astype(object)
+    status[pd.isna(direction) | np.isnan(variance)] = ''
+    return status
+
+
+# Compare two periods for every metric at once.
+# Returns the summary table and the display labels of the two periods.
+def compare(monthly, current, comparison='rolling:1'):
+    current_label, current_values = period_values(monthly, current)
+    comparison_label, comparison_values = period_values(monthly, comparison, current)
+
+    variance = (current_values - comparison_values).astype(float).round(2).to_numpy()
+    table = pd.DataFrame({
+        'Metric': monthly.columns,
+        'Current Value': format_values(current_values),
+        'Comparison Value': format_values(comparison_values),
+        'Variance': variance,
+        'Status': variance_status(monthly.columns, variance),
+    })
+    return table, (current_label, comparison_label)
+
+
+# DataTable column definitions with the period labels as headers
+def table_columns(labels):
+    names = ['Metric', f'{labels[0]} Value', f'{labels[1]} Value', 'Variance']
+    return [{'name': name, 'id': column_id} for name, column_id in zip(names, SUMMARY_COLUMNS)]
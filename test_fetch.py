@@ -0,0 +1,141 @@
+import hashlib
+import http.server
+import threading
+import time
+
+import pytest
+
+import data_source
+import fetch
+
+
+# Local stub server: answers `failures` requests with 503, then serves `body` with an ETag
+# and a 304 to a matching If-None-Match. Paths starting with /slow wait `delay` seconds first.
+class StubServer(http.server.ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.body = b'{"a": [1]}'
+        self.failures = 0
+        self.delay = 0.5
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith('/slow'):
+            time.sleep(server.delay)
+        with server.lock:
+            if server.failures:
+                server.failures -= 1
+                status = 503
+            else:
+                etag = '"' + hashlib.md5(server.body).hexdigest() + '"'
+                status = 304 if self.headers.get('If-None-Match') == etag else 200
+            server.statuses.append(status)
+        self.send_response(status)
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(server.body)
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(fetch, 'FETCH_BACKOFF', 0)
+    monkeypatch.setattr(fetch, 'FETCH_TIMEOUT', 5)
+    monkeypatch.setattr(fetch, 'session', fetch._session())
+
+
+def test_download_retries_server_errors(server, tmp_path):
+    server.failures = 2
+    path = tmp_path / 'data.json'
+
+    assert fetch.download(f'{server.url}/data.json', str(path))
+    assert server.statuses == [503, 503, 200]
+    assert path.read_bytes() == server.body
+
+
+def test_download_gives_up_after_the_retries(server, tmp_path):
+    server.failures = fetch.FETCH_RETRIES + 1
+
+    with pytest.raises(fetch.requests.RequestException):
+        fetch.download(f'{server.url}/data.json', str(tmp_path / 'data.json'))
+    assert not (tmp_path / 'data.json').exists()
+
+
+def test_download_skips_unchanged_resource(server, tmp_path):
+    path = tmp_path / 'data.json'
+
+    assert fetch.download(f'{server.url}/data.json', str(path))
+    assert not fetch.download(f'{server.url}/data.json', str(path))
+    assert server.statuses == [200, 304]
+    assert path.read_bytes() == server.body
+
+
+def test_download_refetches_changed_resource(server, tmp_path):
+    path = tmp_path / 'data.json'
+    fetch.download(f'{server.url}/data.json', str(path))
+    server.body = b'{"a": [2]}'
+
+    assert fetch.download(f'{server.url}/data.json', str(path))
+    assert server.statuses == [200, 200]
+    assert path.read_bytes() == b'{"a": [2]}'
+
+
+def test_run_all_fetches_concurrently(server, tmp_path):
+    calls = [lambda i=i: fetch.download(f'{server.url}/slow/{i}', str(tmp_path / f'{i}.json')) for i in range(4)]
+
+    start = time.perf_counter()
+    assert fetch.run_all(calls) == [True] * 4
+    # Four fetches of delay seconds each take about as long as one
+    assert time.perf_counter() - start < server.delay * 2
+
+
+def test_fetch_remote_checks_at_most_once_per_interval(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_source, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(data_source, 'REMOTE_CHECK_SECONDS', 60)
+    monkeypatch.setattr(data_source, '_remote_checked', {})
+    url = f'{server.url}/data.json'
+
+    path = data_source.fetch_remote(url)
+    assert data_source.fetch_remote(url) == path
+    assert data_source.fetch_remote(url, check=False) == path
+    assert server.statuses == [200]
+
+    monkeypatch.setattr(data_source, 'REMOTE_CHECK_SECONDS', 0)
+    data_source.fetch_remote(url)
+    assert server.statuses == [200, 304]
+
+
+def test_fetch_remote_falls_back_to_downloaded_copy(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_source, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(data_source, 'REMOTE_CHECK_SECONDS', 0)
+    monkeypatch.setattr(data_source, '_remote_checked', {})
+    url = f'{server.url}/data.json'
+    path = data_source.fetch_remote(url)
+
+    server.failures = fetch.FETCH_RETRIES + 1
+    assert data_source.fetch_remote(url) == path
+    with open(path, 'rb') as f:
+        assert f.read() == server.body